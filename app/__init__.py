@@ -1,23 +1,36 @@
 from flask import Flask, render_template, abort
 from flask_login import LoginManager
 from flask_migrate import Migrate
-from flask_sqlalchemy import SQLAlchemy
 from flask_bootstrap import Bootstrap
 
 # local imports
 from config import app_config
+from .database import RoutingSQLAlchemy, configure_database, init_engines, init_routing
+from .instrumentation import Metrics
+from .throttling import LoginGuard
+from .fragment_cache import PageCache
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 login_manager = LoginManager()
+metrics = Metrics()
+page_cache = PageCache()
+login_guard = LoginGuard()
 
 
 def create_app(config_name):
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_object(app_config[config_name])
-    app.config.from_pyfile('config.py')
+    if not app.config.get('TESTING'):
+        app.config.from_pyfile('config.py')
     Bootstrap(app)
 
+    configure_database(app)
     db.init_app(app)
+    metrics.init_app(app)
+    init_engines(app, db, metrics)
+    init_routing(app)
+    page_cache.init_app(app, metrics)
+    login_guard.init_app(app)
     login_manager.init_app(app)
     login_manager.login_message = "You must be logged in to access this page."
     login_manager.login_view = "auth.login"
@@ -37,6 +50,9 @@ def create_app(config_name):
     from .schedule import schedule as schedule_blueprint
     app.register_blueprint(schedule_blueprint)
 
+    from .grades import grades as grades_blueprint
+    app.register_blueprint(grades_blueprint)
+
     @app.errorhandler(403)
     def forbidden(error):
         return render_template('errors/403.html', title='Forbidden'), 403
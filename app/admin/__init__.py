@@ -22,3 +22,5 @@ from . import views_users
 from . import views_plan
 from . import views_schedule
 from . import views_classes
+from . import views_metrics
+from . import views_search
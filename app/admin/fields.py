@@ -0,0 +1,94 @@
+from markupsafe import Markup, escape
+from wtforms.fields import Field
+from wtforms.widgets import html_params
+
+from flask import url_for
+
+from ..models import User
+
+
+class UserSearchWidget(object):
+    """
+    Hidden input with the user id plus a text box that asks the
+    search endpoint for options while the admin types
+    """
+
+    def __call__(self, field, **kwargs):
+        kwargs.setdefault('id', field.id)
+        search_url = url_for('admin.search_users', role=field.role_id) if field.role_id else \
+            url_for('admin.search_users')
+        hidden = html_params(type='hidden', name=field.name, id=field.id, value=field._value())
+        text = html_params(type='text',
+                           id='{}-search'.format(field.id),
+                           list='{}-options'.format(field.id),
+                           value=field.data if field.data else '',
+                           autocomplete='off',
+                           placeholder='Start typing a last name or email',
+                           **{'class': kwargs.get('class', 'form-control'),
+                              'data-typeahead': search_url,
+                              'data-target': field.id})
+        return Markup('<input {}><input {}><datalist id="{}-options"></datalist>'.format(
+            hidden, text, escape(field.id)))
+
+
+class UserSearchField(Field):
+    """
+    Select a user by id without rendering every user as an option.
+    Only the submitted id is checked against query on validation
+    """
+    widget = UserSearchWidget()
+
+    def __init__(self, label=None, validators=None, role_id=None, query_factory=None, **kwargs):
+        super(UserSearchField, self).__init__(label, validators, **kwargs)
+        self.role_id = role_id
+        self.query_factory = query_factory
+        self.query = None
+        self._data = None
+        self._formdata = None
+
+    def _get_query(self):
+        if self.query is not None:
+            return self.query
+        if self.query_factory is not None:
+            return self.query_factory()
+        query = User.query
+        if self.role_id is not None:
+            query = query.filter(User.role_id == self.role_id)
+        return query
+
+    def _get_data(self):
+        if self._formdata is not None:
+            self._set_data(self._get_query().filter(User.id == self._formdata).first())
+        return self._data
+
+    def _set_data(self, data):
+        self._data = data
+        self._formdata = None
+
+    data = property(_get_data, _set_data)
+
+    def _value(self):
+        return str(self.data.id) if self.data is not None else ''
+
+    def process_data(self, value):
+        # populated from a model attribute, which holds the plain user id
+        if isinstance(value, int):
+            self._data = None
+            self._formdata = value
+        else:
+            self.data = value
+
+    def process_formdata(self, valuelist):
+        if valuelist and valuelist[0]:
+            try:
+                self._data = None
+                self._formdata = int(valuelist[0])
+            except ValueError:
+                self._formdata = None
+                self.data = None
+        else:
+            self.data = None
+
+    def pre_validate(self, form):
+        if self.data is None:
+            raise ValueError(self.gettext('Not a valid choice'))
@@ -1,12 +1,15 @@
 import datetime
 
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField
 
 from wtforms import StringField, SubmitField, PasswordField, ValidationError, IntegerField, SelectField, BooleanField, \
-    DateField
+    DateField, SelectMultipleField
 from wtforms.validators import DataRequired, Email, EqualTo, NumberRange, Length
 from wtforms.ext.sqlalchemy.fields import QuerySelectField
 
+from ..cache import reference_cache
+from .fields import UserSearchField
 from ..models import Role, User, RoomSpecialization, Class, Subject, Classroom, EducationPlan, TeacherToSubject, Specialization
 
 
@@ -58,7 +61,7 @@ class RegistrationForm(FlaskForm):
     ])
     confirm_password = PasswordField('Confirm Password')
     is_man = BooleanField('Is man')
-    role = QuerySelectField(query_factory=lambda: Role.query.all(), get_label="name")
+    role = QuerySelectField(query_factory=lambda: reference_cache.all(Role), get_label="name")
     submit = SubmitField('Register')
 
     def validate_email(self, field):
@@ -66,12 +69,21 @@ class RegistrationForm(FlaskForm):
             raise ValidationError('Email is already in use.')
 
 
+class UsersImportForm(FlaskForm):
+    """
+    Form for admin to upload users as CSV or JSON
+    """
+    file = FileField('CSV or JSON file: email, first_name, last_name, middle_name, date_of_birth, telephone, '
+                     'password, role, is_man, class, parent_of')
+    submit = SubmitField('Import')
+
+
 class ClassroomEditForm(FlaskForm):
     """
     Form for admin to assign departments and roles to employees
     """
     name = StringField('Name', validators=[DataRequired()])
-    spec = QuerySelectField(query_factory=lambda: RoomSpecialization.query.all(),
+    spec = QuerySelectField(query_factory=lambda: reference_cache.all(RoomSpecialization),
                             get_label="name")
     submit = SubmitField('Submit')
 
@@ -85,7 +97,7 @@ def get_classes():
 
 
 def get_subjects():
-    return Subject.query
+    return reference_cache.all(Subject)
 
 
 def get_classrooms():
@@ -96,8 +108,8 @@ class ParentToStudentAddForm(FlaskForm):
     """
     Form for admin to edit link between parents and students
     """
-    parent = QuerySelectField(query_factory=get_users)
-    student = QuerySelectField(query_factory=get_users)
+    parent = UserSearchField(role_id=3)
+    student = UserSearchField(role_id=2)
     submit = SubmitField('Submit')
 
 
@@ -105,7 +117,7 @@ class ParentToStudentEditForm(FlaskForm):
     """
     Form for admin to edit student link between parents and students
     """
-    student = QuerySelectField(query_factory=get_users)
+    student = UserSearchField(role_id=2)
     submit = SubmitField('Submit')
 
 
@@ -173,7 +185,17 @@ class PlanFormSemester(FlaskForm):
         Form for admin to add Plan to all semester
     """
     year = IntegerField('Year', [NumberRange(min=1996, max=2017, message=None)], default=(datetime.date.today().year))
+    years_count = IntegerField('Number of years', [NumberRange(min=1, max=10)], default=1)
     semester = SelectField('Semester', choices=[(1, '1 semester'), (2, '2 semester')], coerce=int)
+    days = SelectMultipleField('Days', coerce=int, default=list(range(1, 7)), choices=[(1, 'Monday'),
+                                       (2, 'Tuesday'),
+                                       (3, 'Wednesday'),
+                                       (4, 'Thursday'),
+                                       (5, 'Friday'),
+                                       (6, 'Saturday'),
+                                       (7, 'Sunday')
+                                       ])
+    lessons = IntegerField('Lessons per day', [NumberRange(min=1, max=12)], default=7)
     submit = SubmitField('Submit')
 
 
@@ -183,7 +205,7 @@ class ScheduleFormEdit(FlaskForm):
     """
     classroom_id = QuerySelectField(query_factory=lambda: Classroom.query)
     class_id = QuerySelectField(query_factory=lambda: Class.query)
-    teacher_subject_id = QuerySelectField(query_factory=lambda: TeacherToSubject.query.all())
+    teacher_subject_id = QuerySelectField(query_factory=lambda: TeacherToSubject.with_labels().all())
     submit = SubmitField('Submit')
 
 
@@ -193,7 +215,7 @@ class ScheduleFormAdd(FlaskForm):
     """
     classroom_id = QuerySelectField(query_factory=lambda: Classroom.query)
     class_id = QuerySelectField(query_factory=lambda: Class.query)
-    teacher_subject_id = QuerySelectField(query_factory=lambda: TeacherToSubject.query.all())
+    teacher_subject_id = QuerySelectField(query_factory=lambda: TeacherToSubject.with_labels().all())
     educationPlan_id = QuerySelectField(query_factory=lambda: EducationPlan.query.order_by(EducationPlan.year,EducationPlan.semester).all())
     submit = SubmitField('Submit')
 
@@ -207,6 +229,13 @@ class ScheduleFormAddSubject(FlaskForm):
     submit = SubmitField('Submit')
 
 
+class SchedulePublishForm(FlaskForm):
+    """
+        Form for admin to publish a Schedule version
+    """
+    submit = SubmitField('Publish Schedule')
+
+
 class ClassForm(FlaskForm):
     """
     Form for admin to add or edit a class
@@ -214,8 +243,8 @@ class ClassForm(FlaskForm):
     name = StringField('Name', validators=[DataRequired()])
     dateStartEducation = DateField('DateStart', validators=[DataRequired()])
     dateEndEducation = DateField('DateEnd', validators=[DataRequired()])
-    specialization_id = QuerySelectField(query_factory=lambda: Specialization.query.all())
-    headTeacher = QuerySelectField(query_factory=lambda: User.query.filter_by(role_id=1).all())
+    specialization_id = QuerySelectField(query_factory=lambda: reference_cache.all(Specialization))
+    headTeacher = UserSearchField(role_id=1)
     room_id = QuerySelectField(query_factory=lambda: Classroom.query.all())
     submit = SubmitField('Submit')
 
@@ -228,5 +257,5 @@ class ClassStudentsForm(FlaskForm):
     """
         Form for admin to add a student to class
     """
-    student = QuerySelectField(query_factory=get_students)
+    student = UserSearchField(role_id=2, query_factory=get_students)
     submit = SubmitField('Submit')
\ No newline at end of file
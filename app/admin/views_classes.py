@@ -2,7 +2,10 @@ from flask import abort, flash, redirect, render_template, url_for
 
 from flask_login import current_user, login_required
 from . import admin
-from .. import db
+from .. import db, page_cache
+from ..database import replica_reads
+from ..pagination import keyset_paginate
+from ..cache import reference_cache
 from ..models import Class, StudentInClass, User, Classroom, Specialization
 from .forms import ClassForm, ClassStudentsForm
 
@@ -17,13 +20,14 @@ def check_admin():
 
 @admin.route('/class/list/<int:pagin>')
 @login_required
+@replica_reads
 def list_classes(pagin):
     """
     List of classes
     """
     check_admin()
 
-    classesList = Class.query.order_by(Class.name).paginate(page=pagin, per_page=5)
+    classesList = keyset_paginate(Class.query, [Class.name, Class.id], page=pagin, per_page=5)
     return render_template('admin/classes/class.html',
                            classesList=classesList)
 
@@ -83,6 +87,7 @@ def edit_class(id):
         try:
             db.session.add(classOne)
             db.session.commit()
+            page_cache.invalidate()
             flash('You have successfully edited the class.',category='message')
         except:
             flash('Edited the class error',category='error')
@@ -92,7 +97,7 @@ def edit_class(id):
 
     form.headTeacher.data = User.query.get_or_404(classOne.headTeacher)
     form.room_id.data = Classroom.query.get_or_404(classOne.room_id)
-    form.specialization_id.data = Specialization.query.get_or_404(classOne.specialization_id)
+    form.specialization_id.data = reference_cache.get_or_404(Specialization, classOne.specialization_id)
     return render_template('admin/classes/editClass.html',
                            form=form,
                            class_name=classOne.name,
@@ -110,6 +115,7 @@ def delete_class(id):
     classOne = Class.query.get_or_404(id)
     db.session.delete(classOne)
     db.session.commit()
+    page_cache.invalidate()
     flash('You have successfully deleted the class.')
 
     # redirect to the list of classes PAGE
@@ -131,6 +137,7 @@ def add_student(id):
                                           user_id_studen=form.student.data.id)
             db.session.add(classStudent)
             db.session.commit()
+            page_cache.invalidate('classes')
             flash('You have successfully added a student to the class.',category='message')
         except:
             flash('Error in adding student to class',category='error')
@@ -175,6 +182,7 @@ def delete_student(id_class,id_student):
                                                StudentInClass.user_id_studen == id_student).first()
         db.session.delete(students)
         db.session.commit()
+        page_cache.invalidate('classes')
         flash('You have successfully deleted student from class.',category='message')
     except:
         flash('Error in removing student from class', category='error')
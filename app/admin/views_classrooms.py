@@ -1,5 +1,8 @@
 from . import admin, check_admin
-from .. import db
+from .. import db, page_cache
+from ..database import replica_reads
+from ..pagination import keyset_paginate
+from ..cache import reference_cache
 
 from flask import render_template, flash, redirect, url_for
 from flask_login import login_required
@@ -11,13 +14,14 @@ from ..models import Classroom, RoomSpecialization
 
 @admin.route('/classrooms/<int:pagin>')
 @login_required
+@replica_reads
 def list_classrooms(pagin):
     """
     Show classroom list
     """
     check_admin()
 
-    classrooms = Classroom.query.order_by(Classroom.name).paginate(page=pagin, per_page=5)
+    classrooms = keyset_paginate(Classroom.query, [Classroom.name, Classroom.id], page=pagin, per_page=5)
     return render_template('admin/classrooms/classrooms.html',
                            classrooms=classrooms)
 
@@ -34,6 +38,7 @@ def delete_classroom(id):
         classroom = Classroom.query.get_or_404(id)
         db.session.delete(classroom)
         db.session.commit()
+        page_cache.invalidate()
         flash('You have successfully deleted the Classroom.', category='message')
     except:
         flash('Error in removing the Classroom.', category='error')
@@ -86,6 +91,7 @@ def edit_classroom(id):
             classroom.room_specialization_id = form.spec.data.id
             db.session.add(classroom)
             db.session.commit()
+            page_cache.invalidate()
             flash('You have successfully changed name of the Classroom Specialization.', category='message')
         except:
             flash('Error in changing the name of the Classroom Specialization.', category='error')
@@ -94,7 +100,7 @@ def edit_classroom(id):
         return redirect(url_for('admin.list_classrooms', pagin=1))
 
     form.name.data = classroom.name
-    form.spec.data = RoomSpecialization.query.get_or_404(classroom.room_specialization_id)
+    form.spec.data = reference_cache.get_or_404(RoomSpecialization, classroom.room_specialization_id)
 
     return render_template('admin/classrooms/classroom.html',
                            classroom_name=classroom.name,
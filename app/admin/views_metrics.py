@@ -0,0 +1,22 @@
+from . import admin, check_admin
+from .. import metrics, page_cache
+
+from flask import render_template
+from flask_login import login_required
+
+
+@admin.route('/metrics')
+@login_required
+def list_metrics():
+    """
+    Show per-endpoint query count and latency, counters, page cache hit ratios
+    and connection pool usage
+    """
+    check_admin()
+
+    return render_template('admin/metrics/list.html',
+                           endpoints=metrics.summary(),
+                           counters=sorted(metrics.counters.items()),
+                           pageCache=page_cache.hit_ratios(),
+                           pools=metrics.pool_summary(),
+                           title='Metrics')
@@ -1,5 +1,7 @@
 from . import admin, check_admin
 from .. import db
+from ..database import replica_reads
+from ..pagination import keyset_paginate
 
 from flask import render_template, flash, redirect, url_for
 from flask_login import login_required
@@ -11,13 +13,15 @@ from ..models import User, ParentToStudent
 
 @admin.route('/parent_to_student/<int:pagin>')
 @login_required
+@replica_reads
 def list_parent_to_student(pagin):
     """
     A list link between parents and students
     """
     check_admin()
 
-    parent_to_student = ParentToStudent.query.order_by(ParentToStudent.user_id_parent).paginate(page=pagin, per_page=10)
+    parent_to_student = keyset_paginate(ParentToStudent.query, [ParentToStudent.user_id_parent, ParentToStudent.id],
+                                        page=pagin, per_page=10, estimate=True)
 
     return render_template('admin/parent_to_student/list.html',
                            parent_to_student=parent_to_student)
@@ -1,21 +1,28 @@
 from . import *
-from .. import db
+from .. import db, page_cache
+from ..database import replica_reads
+from ..pagination import keyset_paginate
 
 from flask import render_template, flash, redirect, url_for
 from flask_login import login_required
 
 from .forms import PlanForm, PlanFormDay, PlanFormSemester
 from ..models import EducationPlan
+from ..plans import generate_plans
 
 @admin.route('/plans/<int:pagin>')
 @login_required
+@replica_reads
 def list_plan(pagin):
     """
     Show plan list
     """
     check_admin()
 
-    educationPlan = EducationPlan.query.order_by(EducationPlan.year, EducationPlan.semester, EducationPlan.day, EducationPlan.lessonNumber).paginate(page=pagin, per_page=10)
+    educationPlan = keyset_paginate(EducationPlan.query,
+                                    [EducationPlan.year, EducationPlan.semester, EducationPlan.day,
+                                     EducationPlan.lessonNumber, EducationPlan.id],
+                                    page=pagin, per_page=10, estimate=True)
     return render_template('admin/plans/list.html',
                            educationPlan=educationPlan,
                            title="Education Plan")
@@ -33,6 +40,7 @@ def delete_plan(id):
         plan = EducationPlan.query.get_or_404(id)
         db.session.delete(plan)
         db.session.commit()
+        page_cache.invalidate('schedule')
         flash('You have successfully deleted the plan.',category='message')
     except:
         flash('Error. Delete the plan.',category='error')
@@ -83,6 +91,7 @@ def edit_plan(id):
         try:
             db.session.add(plan)
             db.session.commit()
+            page_cache.invalidate('schedule')
             flash('You have successfully edit the Plan.',category='message')
         except:
             flash('Error. Edit the Plan.', category='error')
@@ -105,17 +114,12 @@ def add_plan_day():
 
     form = PlanFormDay()
     if form.validate_on_submit():
-        for leson in range(1,8):
-            plan = EducationPlan(year=form.year.data,
-                                 day=form.day.data,
-                                 lessonNumber=leson,
-                                 semester=form.semester.data)
-            try:
-                db.session.add(plan)
-                db.session.commit()
-                flash('You have successfully add the Plan.{}'.format(plan), category='message')
-            except:
-                flash('Such a Plan already exists.', category='error')
+        try:
+            created = generate_plans([form.year.data], [form.semester.data], [form.day.data])
+            flash('You have successfully added {} Plans.'.format(created), category='message')
+        except:
+            db.session.rollback()
+            flash('Error in adding the Plans.', category='error')
 
         return redirect(url_for('admin.list_plan', pagin=1))
 
@@ -128,27 +132,22 @@ def add_plan_day():
 @login_required
 def add_plan_semester():
     """
-    Add one plan
+    Add plans to all semester
     """
     check_admin()
 
     form = PlanFormSemester()
     if form.validate_on_submit():
-        for day in range(1,7):
-            for leson in range(1,8):
-                plan = EducationPlan(year=form.year.data,
-                                     day=day,
-                                     lessonNumber=leson,
-                                     semester=form.semester.data)
-                try:
-                    db.session.add(plan)
-                    db.session.commit()
-                    flash('You have successfully add the Plan.{}'.format(plan), category='message')
-                except:
-                    flash('Such a Plan already exists.', category='error')
+        years = range(form.year.data, form.year.data + form.years_count.data)
+        try:
+            created = generate_plans(years, [form.semester.data], form.days.data, range(1, form.lessons.data + 1))
+            flash('You have successfully added {} Plans.'.format(created), category='message')
+        except:
+            db.session.rollback()
+            flash('Error in adding the Plans.', category='error')
 
         return redirect(url_for('admin.list_plan', pagin=1))
 
     return render_template('admin/plans/plan.html',
                            form=form,
-                           title='Add Plan 1-6 day 1-7 lesson')
\ No newline at end of file
+                           title='Add Plan to semester')
@@ -1,5 +1,7 @@
 from . import admin, check_admin
 from .. import db
+from ..database import replica_reads
+from ..cache import reference_cache
 
 from flask import render_template, flash, redirect, url_for
 from flask_login import login_required
@@ -10,6 +12,7 @@ from ..models import Role
 
 @admin.route('/roles')
 @login_required
+@replica_reads
 def list_roles():
     """
     Show roles
@@ -39,6 +42,7 @@ def add_role():
             # add role to the database
             db.session.add(role)
             db.session.commit()
+            reference_cache.invalidate(Role)
             flash('You have successfully added a new Role.',category='message')
         except:
             flash('Error: Role name already exists.',category='error')
@@ -67,6 +71,7 @@ def edit_role(id):
             role.description = form.description.data
             db.session.add(role)
             db.session.commit()
+            reference_cache.invalidate(Role)
             flash('You have successfully edited the Role neme.',category='message')
         except:
             flash('Error in changing Roles name.', category='error')
@@ -92,6 +97,7 @@ def delete_role(id):
     try:
         db.session.delete(role)
         db.session.commit()
+        reference_cache.invalidate(Role)
         flash('You have successfully deleted the Role.',category='message')
     except:
         flash('Error in removing Roles.', category='error')
@@ -4,16 +4,23 @@ from flask_sqlalchemy import Pagination
 from sqlalchemy.orm.exc import NoResultFound
 
 from . import admin, check_admin
-from .. import db
+from .. import db, page_cache
+from ..database import replica_reads
+from ..pagination import keyset_paginate
 
 from flask import render_template, flash, redirect, url_for, abort
 from flask_login import login_required, current_user
 
 from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, joinedload, undefer
 
-from .forms import ScheduleFormEdit, ScheduleFormAdd, ScheduleFormAddSubject
+from .forms import ScheduleFormEdit, ScheduleFormAdd, ScheduleFormAddSubject, SchedulePublishForm
 
-from ..models import Schedule, EducationPlan, Classroom, Class, TeacherToSubject
+from ..conflicts import BOOKED, KINDS, audit_semester, conflicts_message, find_conflicts
+from ..models import Schedule, EducationPlan, Classroom, Class, TeacherToSubject, PublishedSchedule
+from ..schedule.publishing import EMPTY, diff_versions, load, publish, version_cache
+from ..schedule.timetable import DAYS
 
 
 def user_access():
@@ -35,6 +42,7 @@ def curr_semester():
 
 @admin.route('/schedule')
 @login_required
+@replica_reads
 def list_schedule():
     """
     Show schedule
@@ -61,6 +69,12 @@ def add_schedule_subject(id_subject, id_day, id_plan):
 
     form = ScheduleFormAddSubject()
     if form.validate_on_submit():
+        conflicts = find_conflicts(id_plan, form.class_id.data.id, form.classroom_id.data.id, id_subject)
+        if conflicts:
+            flash('Error in adding Schedule: {}.'.format(conflicts_message(conflicts)), category='error')
+            plan = EducationPlan.query.get_or_404(id_plan)
+            return redirect(url_for('admin.list_schedule_year_sem', year=plan.year, semester=plan.semester, pagin=1))
+
         try:
             schedule = Schedule(classroom_id=form.classroom_id.data.id,
                                 class_id=form.class_id.data.id,
@@ -68,7 +82,11 @@ def add_schedule_subject(id_subject, id_day, id_plan):
                                 educationPlan_id=id_plan)
             db.session.add(schedule)
             db.session.commit()
+            page_cache.invalidate('schedule')
             flash('You have successfully added Schedule.', category='message')
+        except IntegrityError:
+            db.session.rollback()
+            flash('Error in adding Schedule: {}.'.format(BOOKED), category='error')
         except:
             flash('Error in adding Schedule.', category='error')
 
@@ -92,6 +110,7 @@ def delete_schedule_subject(id_subject, id_day, id):
     try:
         db.session.delete(schedules)
         db.session.commit()
+        page_cache.invalidate('schedule')
         flash('You have successfully deleted the Schedule.', category='message')
     except:
         flash('Error in removing Schedule.', category='error')
@@ -102,13 +121,20 @@ def delete_schedule_subject(id_subject, id_day, id):
 
 @admin.route('/schedule/<int:year>/<int:semester>/<int:pagin>')
 @login_required
+@replica_reads
 def list_schedule_year_sem(year, semester, pagin):
     """
     Show schedule
     """
     user_access()
 
-    schedules = Schedule.query.outerjoin(EducationPlan, EducationPlan.id==Schedule.educationPlan_id).filter(EducationPlan.year==year, EducationPlan.semester==semester).order_by(EducationPlan.day, EducationPlan.lessonNumber).paginate(page=pagin, per_page=10)
+    schedules = keyset_paginate(Schedule.query.outerjoin(EducationPlan, EducationPlan.id==Schedule.educationPlan_id).filter(EducationPlan.year==year, EducationPlan.semester==semester)
+                                .options(contains_eager(Schedule.education_plan),
+                                         joinedload(Schedule.teachers_to_subjects).joinedload(TeacherToSubject.users),
+                                         joinedload(Schedule.teachers_to_subjects).joinedload(TeacherToSubject.subjects),
+                                         joinedload(Schedule.classes),
+                                         joinedload(Schedule.classrooms)),
+                                [EducationPlan.day, EducationPlan.lessonNumber, Schedule.id], page=pagin, per_page=10)
 
     return render_template('admin/schedule/yearSemesterList.html',
                            schedules=schedules,
@@ -127,6 +153,12 @@ def add_schedule_year_sem(year, semester):
 
     form = ScheduleFormAdd()
     if form.validate_on_submit():
+        conflicts = find_conflicts(form.educationPlan_id.data.id, form.class_id.data.id,
+                                   form.classroom_id.data.id, form.teacher_subject_id.data.id)
+        if conflicts:
+            flash('Error in adding Schedule: {}.'.format(conflicts_message(conflicts)), category='error')
+            return redirect(url_for('admin.list_schedule_year_sem', year=year, semester=semester, pagin=1))
+
         try:
             schedule = Schedule(classroom_id=form.classroom_id.data.id,
                                 class_id=form.class_id.data.id,
@@ -134,7 +166,11 @@ def add_schedule_year_sem(year, semester):
                                 educationPlan_id=form.educationPlan_id.data.id)
             db.session.add(schedule)
             db.session.commit()
+            page_cache.invalidate('schedule')
             flash('You have successfully added Schedule.', category='message')
+        except IntegrityError:
+            db.session.rollback()
+            flash('Error in adding Schedule: {}.'.format(BOOKED), category='error')
         except:
             flash('Error in adding Schedule.', category='error')
 
@@ -158,13 +194,25 @@ def edit_schedule_year_sem(plan_id, year, semester):
     schedules = Schedule.query.filter_by(educationPlan_id=plan_id).first()
     form = ScheduleFormEdit(obj=schedules)
     if form.validate_on_submit():
+        conflicts = find_conflicts(plan_id, form.class_id.data.id, form.classroom_id.data.id,
+                                   form.teacher_subject_id.data.id, exclude_id=schedules.id if schedules else None)
+        if conflicts:
+            flash('Error in changing Schedule: {}.'.format(conflicts_message(conflicts)), category='error')
+            return redirect(url_for('admin.list_schedule_year_sem', year=year, semester=semester, pagin=1))
+
         try:
+            if schedules is None:
+                schedules = Schedule(educationPlan_id=plan_id)
             schedules.classroom_id = form.classroom_id.data.id
             schedules.class_id = form.class_id.data.id
             schedules.teacher_subject_id = form.teacher_subject_id.data.id
             db.session.add(schedules)
             db.session.commit()
+            page_cache.invalidate('schedule')
             flash('You have successfully edited Schedule.', category='message')
+        except IntegrityError:
+            db.session.rollback()
+            flash('Error in changing Schedule: {}.'.format(BOOKED), category='error')
         except:
             flash('Error in changing Schedule.', category='error')
 
@@ -192,9 +240,114 @@ def delete_schedule_year_sem(id, year, semester):
     try:
         db.session.delete(schedules)
         db.session.commit()
+        page_cache.invalidate('schedule')
         flash('You have successfully deleted the Schedule.', category='message')
     except:
         flash('Error in removing Schedule.', category='error')
 
     # redirect to the list roles PAGE
-    return redirect(url_for('admin.list_schedule_year_sem', year=year, semester=semester, pagin=1))
\ No newline at end of file
+    return redirect(url_for('admin.list_schedule_year_sem', year=year, semester=semester, pagin=1))
+
+
+@admin.route('/schedule/<int:year>/<int:semester>/conflicts')
+@login_required
+@replica_reads
+def list_schedule_conflicts(year, semester):
+    """
+    Show double bookings of classes, teachers and classrooms
+    """
+    user_access()
+
+    conflicts = audit_semester(year, semester)
+    plans = dict((plan.id, plan) for plan in
+                 EducationPlan.query.filter(EducationPlan.id.in_(set(c.plan_id for c in conflicts))))
+    return render_template('admin/schedule/conflictsList.html',
+                           conflicts=conflicts,
+                           plans=plans,
+                           kinds=KINDS,
+                           year=year,
+                           semester=semester,
+                           title='Schedule conflicts')
+
+
+@admin.route('/schedule/<int:year>/<int:semester>/publish', methods=['POST'])
+@login_required
+def publish_schedule(year, semester):
+    """
+    Publish the current schedule as a new immutable version
+    """
+    check_admin()
+
+    if not SchedulePublishForm().validate_on_submit():
+        flash('Error in publishing Schedule.', category='error')
+        return redirect(url_for('admin.list_schedule_versions', year=year, semester=semester))
+
+    try:
+        version = publish(year, semester)
+        if version is None:
+            flash('Schedule has not changed since the last published version.', category='message')
+        else:
+            db.session.commit()
+            flash('You have successfully published version {} of the Schedule.'.format(version.number),
+                  category='message')
+    except:
+        db.session.rollback()
+        flash('Error in publishing Schedule.', category='error')
+
+    # redirect to the list versions PAGE
+    return redirect(url_for('admin.list_schedule_versions', year=year, semester=semester))
+
+
+@admin.route('/schedule/<int:year>/<int:semester>/versions')
+@login_required
+@replica_reads
+def list_schedule_versions(year, semester):
+    """
+    Show published versions and how many lessons each one changed
+    """
+    user_access()
+
+    # one query for every blob, and room in the cache for each version and its diff
+    versions = PublishedSchedule.query.filter_by(year=year, semester=semester) \
+        .options(undefer(PublishedSchedule.data)) \
+        .order_by(PublishedSchedule.number.desc()).all()
+    version_cache.reserve(2 * len(versions))
+    changes = {}
+    previous = EMPTY
+    for version in reversed(versions):
+        current = load(version)
+        changes[version.id] = diff_versions(previous, current)
+        previous = current
+
+    return render_template('admin/schedule/versionsList.html',
+                           form=SchedulePublishForm(),
+                           versions=versions,
+                           changes=changes,
+                           year=year,
+                           semester=semester,
+                           title='Published schedules')
+
+
+@admin.route('/schedule/<int:year>/<int:semester>/versions/<int:number>')
+@login_required
+@replica_reads
+def schedule_version_changes(year, semester, number):
+    """
+    Show lessons added, removed and moved by one published version
+    """
+    user_access()
+
+    version = PublishedSchedule.query.filter_by(year=year, semester=semester, number=number).first_or_404()
+    previous = PublishedSchedule.query.filter_by(year=year, semester=semester, number=number - 1).first()
+    old = load(previous) if previous else EMPTY
+    new = load(version)
+
+    return render_template('admin/schedule/versionChanges.html',
+                           version=version,
+                           changes=diff_versions(old, new),
+                           old=old,
+                           new=new,
+                           days=DAYS,
+                           year=year,
+                           semester=semester,
+                           title='Schedule version {}'.format(number))
@@ -0,0 +1,40 @@
+from . import admin, check_admin
+from ..database import replica_reads
+from ..search import KINDS, search
+
+from flask import render_template, request, jsonify, url_for
+from flask_login import login_required
+
+MAX_HITS = 50
+
+
+def hit_url(hit):
+    if hit.kind == 'user':
+        return url_for('admin.edit_user', id=hit.id)
+    if hit.kind == 'class':
+        return url_for('home.class_dashboard', id=hit.id)
+    if hit.kind == 'subject':
+        return url_for('admin.edit_subject', id=hit.id)
+    return url_for('admin.edit_classroom', id=hit.id)
+
+
+@admin.route('/search')
+@login_required
+@replica_reads
+def global_search():
+    """
+    Users, classes, subjects and classrooms matching q, as a page or as JSON
+    """
+    check_admin()
+
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_HITS)
+    hits = search(query, limit)
+    if request.args.get('format') == 'json':
+        return jsonify([{'kind': hit.kind, 'id': hit.id, 'label': hit.label, 'url': hit_url(hit)}
+                        for hit in hits])
+
+    return render_template('admin/search/results.html',
+                           query=query,
+                           hits=[(KINDS[hit.kind], hit.label, hit_url(hit)) for hit in hits],
+                           title='Search')
@@ -2,20 +2,24 @@ from flask import flash, redirect, render_template, url_for
 from flask_login import login_required
 
 from . import admin, check_admin
-from .. import db
+from .. import db, page_cache
+from ..database import replica_reads
+from ..pagination import keyset_paginate
+from ..cache import reference_cache
 from .forms import SpecializationForm
 from ..models import Specialization, RoomSpecialization, Subject
 
 
 @admin.route('/class_specializations/<int:pagin>')
 @login_required
+@replica_reads
 def list_class_specializations(pagin):
     """
     Show the list of specializations of classes
     """
     check_admin()
 
-    specializations = Specialization.query.order_by(Specialization.name).paginate(page=pagin, per_page=5)
+    specializations = keyset_paginate(Specialization.query, [Specialization.name, Specialization.id], page=pagin, per_page=5)
 
     return render_template('admin/class_specializations/class_specializations.html',
                            specializations=specializations)
@@ -35,6 +39,7 @@ def add_class_specialization():
             specialization = Specialization(name=form.name.data)
             db.session.add(specialization)
             db.session.commit()
+            reference_cache.invalidate(Specialization)
             flash('You have successfully added a new Class Specialization.',category='message')
         except:
             flash('Error: Class Specialization name already exists.',category='error')
@@ -59,6 +64,7 @@ def delete_class_specialization(id):
         specialization = Specialization.query.get_or_404(id)
         db.session.delete(specialization)
         db.session.commit()
+        reference_cache.invalidate(Specialization)
         flash('You have successfully deleted the Class Specialization.',category='message')
     except:
         flash('error in removing the Class Specialization.', category='error')
@@ -82,6 +88,7 @@ def edit_class_specialization(id):
             specialization.name = form.name.data
             db.session.add(specialization)
             db.session.commit()
+            reference_cache.invalidate(Specialization)
             flash('You have successfully edited the Class Specialization name.', category='message')
         except:
             flash('Error in changing Class Specialization name.', category='error')
@@ -98,13 +105,15 @@ def edit_class_specialization(id):
 
 @admin.route('/room_specializations/<int:pagin>')
 @login_required
+@replica_reads
 def list_room_specializations(pagin):
     """
     Show the list of specializations of classroom
     """
     check_admin()
 
-    room_specializations = RoomSpecialization.query.order_by(RoomSpecialization.name).paginate(page=pagin, per_page=5)
+    room_specializations = keyset_paginate(RoomSpecialization.query, [RoomSpecialization.name, RoomSpecialization.id],
+                                           page=pagin, per_page=5)
     return render_template('admin/room_specializations/room_specializations.html',
                            room_specializations=room_specializations)
 
@@ -123,6 +132,7 @@ def add_room_specialization():
             room_specialization = RoomSpecialization(name=form.name.data)
             db.session.add(room_specialization)
             db.session.commit()
+            reference_cache.invalidate(RoomSpecialization)
             flash('You have successfully added a new Classroom Specialization.',category='message')
         except:
             flash('Error: Classroom Specialization name already exists.',category='error')
@@ -147,6 +157,7 @@ def delete_room_specialization(id):
         room_specializations = RoomSpecialization.query.get_or_404(id)
         db.session.delete(room_specializations)
         db.session.commit()
+        reference_cache.invalidate(RoomSpecialization)
         flash('You have successfully deleted the Classroom Specialization.', category='message')
     except:
         flash('Error in removing the Classroom Specialization.', category='error')
@@ -170,6 +181,7 @@ def edit_room_specialization(id):
             room_specialization.name = form.name.data
             db.session.add(room_specialization)
             db.session.commit()
+            reference_cache.invalidate(RoomSpecialization)
             flash('You have successfully edited the Classroom Specialization name.', category='message')
         except:
             flash('Error in changing Classroom Specialization name.', category='error')
@@ -186,13 +198,14 @@ def edit_room_specialization(id):
 
 @admin.route('/subjects/<int:pagin>')
 @login_required
+@replica_reads
 def list_subjects(pagin):
     """"
     Show the list of subjects
     """
     check_admin()
 
-    subjects = Subject.query.order_by(Subject.name).paginate(page=pagin, per_page=5)
+    subjects = keyset_paginate(Subject.query, [Subject.name, Subject.id], page=pagin, per_page=5)
     return render_template('admin/subjects/list.html',
                            subjects=subjects)
 
@@ -211,6 +224,7 @@ def add_subject():
             subject = Subject(name=form.name.data)
             db.session.add(subject)
             db.session.commit()
+            reference_cache.invalidate(Subject)
             flash('You have successfully added a new Subject.', category='message')
         except:
             flash('Error: Subject name already exists.', category='error')
@@ -238,6 +252,8 @@ def edit_subject(id):
             subject.name = form.name.data
             db.session.add(subject)
             db.session.commit()
+            reference_cache.invalidate(Subject)
+            page_cache.invalidate()
             flash('You have successfully edited the Subject name.', category='message')
         except:
             flash('Error in changing Subject name.', category='error')
@@ -264,6 +280,8 @@ def delete_subject(id):
         subject = Subject.query.get_or_404(id)
         db.session.delete(subject)
         db.session.commit()
+        reference_cache.invalidate(Subject)
+        page_cache.invalidate()
         flash('You have successfully deleted the Subject.', category='message')
     except:
         flash('Error in removing the Subject.', category='error')
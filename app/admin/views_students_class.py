@@ -1,5 +1,7 @@
 from . import admin, check_admin
-from .. import db
+from .. import db, page_cache
+from ..database import replica_reads
+from ..pagination import keyset_paginate
 
 from flask import render_template, flash, redirect, url_for
 from flask_login import login_required
@@ -10,16 +12,29 @@ from ..models import User, StudentInClass, Class
 
 @admin.route('/students_class/<int:pagin>')
 @login_required
+@replica_reads
 def list_students_class(pagin):
     """
     A list link between students and class
     """
     check_admin()
 
-    students = User.query.filter_by(role_id=2).order_by(User.last_name).outerjoin(StudentInClass, User.id==StudentInClass.user_id_studen).paginate(page=pagin, per_page=10)
+    # page over the students alone, a join would repeat a student per class link
+    students = keyset_paginate(User.query.filter_by(role_id=2), [User.last_name, User.id], page=pagin, per_page=10)
+
+    # then load the page's classes in one query instead of one per student
+    student_ids = [student.id for student in students.items]
+    classes = {}
+    if student_ids:
+        for student_id, student_class in db.session.query(StudentInClass.user_id_studen, Class) \
+                .join(Class, Class.id == StudentInClass.class_id) \
+                .filter(StudentInClass.user_id_studen.in_(student_ids)) \
+                .order_by(StudentInClass.id):
+            classes.setdefault(student_id, student_class)
 
     return render_template('admin/students/list.html',
-                           students=students)
+                           students=students,
+                           classes=classes)
 
 
 @admin.route('/students_class/add/<int:id>', methods=['GET', 'POST'])
@@ -39,6 +54,7 @@ def add_students_class(id):
                                               user_id_studen=id)
             db.session.add(student_to_class)
             db.session.commit()
+            page_cache.invalidate('classes')
             flash('You have successfully added a new link between Student and Class.',category='message')
         except:
             flash('Error in adding a new link between Student and Class',category='error')
@@ -63,6 +79,7 @@ def delete_students_class(id):
         student_to_class = StudentInClass.query.filter_by(user_id_studen=id).first()
         db.session.delete(student_to_class)
         db.session.commit()
+        page_cache.invalidate('classes')
         flash('You have successfully deleted link between Students and Class.',category='message')
     except:
         flash('Error in deleting link between Students and Class', category='error')
@@ -93,6 +110,7 @@ def edit_students_class(id):
         try:
             db.session.add(student_to_class)
             db.session.commit()
+            page_cache.invalidate('classes')
             flash('You have successfully edit link between Students and Class.', category='message')
         except:
             flash('Error in linking Student to Class.', category='error')
@@ -2,23 +2,53 @@ from flask import flash, redirect, render_template, url_for
 from flask_login import login_required
 
 from . import admin, check_admin
-from .. import db
+from .. import db, page_cache
+from ..database import replica_reads
+from ..pagination import keyset_paginate
+from ..cache import reference_cache
 from .forms import TeacherSubjectAddForm, TeacherClassroomEditForm
-from ..models import User, TeacherToSubject, TeachersClassroom, Classroom, Subject
+from ..models import User, TeacherToSubject, TeachersClassroom, Classroom, Subject, RoomSpecialization, Class
 
 
 @admin.route('/teachers/list/<int:pagin>')
 @login_required
+@replica_reads
 def list_teachers_info(pagin):
     """
     A list with info about teachers
     """
     check_admin()
 
-    teachers = User.query.filter_by(role_id=1).order_by(User.last_name).paginate(page=pagin, per_page=10)
+    teachers = keyset_paginate(User.query.filter_by(role_id=1), [User.last_name, User.id], page=pagin, per_page=10)
+
+    # load the page's subjects, classrooms and head classes in one query each
+    # instead of walking the dynamic relationships per teacher
+    teacher_ids = [teacher.id for teacher in teachers.items]
+    subjects = {}
+    classrooms = {}
+    head_classes = {}
+    if teacher_ids:
+        for teacher_subject, subject in db.session.query(TeacherToSubject, Subject) \
+                .join(Subject, Subject.id == TeacherToSubject.subject_id) \
+                .filter(TeacherToSubject.user_id_teacher.in_(teacher_ids)) \
+                .order_by(Subject.name):
+            subjects.setdefault(teacher_subject.user_id_teacher, []).append(subject)
+
+        for teacher_id, classroom, room_specialization in db.session.query(TeachersClassroom.user_id_teacher,
+                                                                           Classroom, RoomSpecialization) \
+                .join(Classroom, Classroom.id == TeachersClassroom.classroom_id) \
+                .join(RoomSpecialization, RoomSpecialization.id == Classroom.room_specialization_id) \
+                .filter(TeachersClassroom.user_id_teacher.in_(teacher_ids)):
+            classrooms[teacher_id] = (classroom, room_specialization)
+
+        for head_class in Class.query.filter(Class.headTeacher.in_(teacher_ids)).order_by(Class.id):
+            head_classes.setdefault(head_class.headTeacher, head_class)
 
     return render_template('admin/teachers/list.html',
-                           teachers=teachers)
+                           teachers=teachers,
+                           subjects=subjects,
+                           classrooms=classrooms,
+                           head_classes=head_classes)
 
 
 @admin.route('/teachers/<int:id_teacher>/subject/add', methods=['GET', 'POST'])
@@ -34,11 +64,12 @@ def add_teacher_subjects(id_teacher):
     form = TeacherSubjectAddForm()
     if form.validate_on_submit():
         try:
-            subject = Subject.query.get_or_404(form.subject.data.id)
+            subject = reference_cache.get_or_404(Subject, form.subject.data.id)
             teacher_subject = TeacherToSubject(user_id_teacher=id_teacher,
                                                subject_id=subject.id)
             db.session.add(teacher_subject)
             db.session.commit()
+            page_cache.invalidate('teachers', 'schedule')
             flash('You have successfully added a subject to the list of teacher\'s subjects.', category='message')
         except:
             flash('Error in adding an item to the list of teacher\'s subjects. This relationship already exists.', category='error')
@@ -77,6 +108,7 @@ def delete_teacher_subjects(id_teacher, id_subject):
                                                          TeacherToSubject.user_id_teacher == id_teacher).first()
         db.session.delete(teacher_subject)
         db.session.commit()
+        page_cache.invalidate('teachers', 'schedule')
         flash('You successfully deleted an item from the teacher\'s subject list.', category='message')
     except:
         flash('Error in removing the item from the teacher\'s subject list', category='error')
@@ -104,6 +136,7 @@ def add_teacher_classroom(id_teacher):
                                                   classroom_id=classroom.id)
             db.session.add(teacher_classroom)
             db.session.commit()
+            page_cache.invalidate('teachers')
             flash('You have successfully added a link between Teacher and the Classroom.', category='message')
         except:
             flash('Error in linking between Teacher and Class', category='error')
@@ -134,6 +167,7 @@ def edit_teacher_classroom(id_teacher):
             teacher_classroom.classroom_id = classroom.id
             db.session.add(teacher_classroom)
             db.session.commit()
+            page_cache.invalidate('teachers')
             flash('You have successfully changed a link between Teacher and the Classroom.', category='message')
         except:
             flash('Error in changing the binding between Teacher and Class', category='error')
@@ -159,6 +193,7 @@ def delete_teacher_classroom(id_teacher):
         teacher_classroom = TeachersClassroom.query.filter(TeacherToSubject.user_id_teacher == id_teacher).first()
         db.session.delete(teacher_classroom)
         db.session.commit()
+        page_cache.invalidate('teachers')
         flash('You have successfully deleted link between Teacher and Classroom.')
     except:
         flash('An error in deleting the relationship between Teacher and Classroom', category='error')
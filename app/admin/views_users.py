@@ -1,27 +1,46 @@
+import json
+
 from . import admin, check_admin
-from .. import db
+from .. import db, page_cache
+from ..database import replica_reads
+from ..pagination import keyset_paginate
+from ..cache import user_cache
 
-from flask import render_template, flash, redirect, url_for
+from flask import render_template, flash, redirect, url_for, request, jsonify, abort
 from flask_login import login_required
 
-from .forms import RegistrationForm, UserEditForm
+from .forms import RegistrationForm, UserEditForm, UsersImportForm
 
-from ..models import User
+from ..models import User, search_users_by_prefix
+from ..jobs import job_path, start_command
 
 
 @admin.route('/users/<int:pagin>')
 @login_required
+@replica_reads
 def list_users(pagin):
     """
     List all users
     """
     check_admin()
 
-    users = User.query.order_by(User.role_id,User.last_name).paginate(page=pagin, per_page=10)
+    users = keyset_paginate(User.query, [User.role_id, User.last_name, User.id], page=pagin, per_page=10, estimate=True)
     return render_template('admin/users/users.html',
                            users=users)
 
 
+@admin.route('/users/search')
+@login_required
+def search_users():
+    """
+    Users whose last name or email starts with q, as JSON options
+    """
+    check_admin()
+
+    users = search_users_by_prefix(request.args.get('q', ''), request.args.get('role', type=int))
+    return jsonify([{'id': user.id, 'label': str(user)} for user in users])
+
+
 @admin.route('/users/add', methods=['GET', 'POST'])
 @login_required
 def add_user():
@@ -55,6 +74,49 @@ def add_user():
                            form=form)
 
 
+@admin.route('/users/import', methods=['GET', 'POST'])
+@login_required
+def import_users_file():
+    """
+    Bulk import of users from a CSV/JSON upload or a JSON list. Hashing
+    thousands of passwords takes minutes, so the file is handed over to
+    "manage.py import_users" running in the background
+    """
+    check_admin()
+
+    if request.is_json:
+        records = request.get_json()
+        if not isinstance(records, list):
+            abort(400)
+        try:
+            path = job_path('import_users', '.json')
+            with open(path, 'w') as upload:
+                json.dump(records, upload)
+            log = start_command('import_users', '-f', path)
+        except:
+            db.session.rollback()
+            abort(500)
+        return jsonify(rows=len(records), log=log), 202
+
+    form = UsersImportForm()
+    if form.validate_on_submit() and form.file.data:
+        try:
+            filename = form.file.data.filename or ''
+            path = job_path('import_users', '.json' if filename.lower().endswith(('.json', '.jsonl')) else '.csv')
+            form.file.data.save(path)
+            log = start_command('import_users', '-f', path)
+            flash('Users are being imported, see {} for the result.'.format(log), category='message')
+        except:
+            db.session.rollback()
+            flash('Error in importing users.', category='error')
+
+        return redirect(url_for('admin.list_users', pagin=1))
+
+    return render_template('admin/users/import.html',
+                           form=form,
+                           title='Import users')
+
+
 @admin.route('/users/delete/<int:id>', methods=['GET', 'POST'])
 @login_required
 def delete_user(id):
@@ -67,6 +129,8 @@ def delete_user(id):
         user = User.query.get_or_404(id)
         db.session.delete(user)
         db.session.commit()
+        user_cache.invalidate(id)
+        page_cache.invalidate()
         flash('You have successfully deleted the user.',category='message')
     except:
         flash('Error in deleting user.', category='error')
@@ -97,6 +161,8 @@ def edit_user(id):
             user.is_man = form.is_man.data
             db.session.add(user)
             db.session.commit()
+            user_cache.invalidate(id)
+            page_cache.invalidate()
             flash('You have successfully changed the user information.',category='message')
         except:
             flash('Error in changing user information.', category='error')
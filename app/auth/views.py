@@ -1,19 +1,47 @@
-from flask import flash, redirect, render_template, url_for
-from flask_login import login_required, login_user, logout_user
+import time
+
+from flask import flash, redirect, render_template, request, url_for
+from flask_login import current_user, login_required, login_user, logout_user
 
 from . import auth
 from .forms import LoginForm
+from .. import db, login_guard, metrics
+from ..cache import user_cache
 from ..models import User
+from ..throttling import LoginBusy
 
 @auth.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
+        started = time.time()
+
+        throttled = login_guard.throttled(form.email.data, request.remote_addr or '')
+        if throttled:
+            metrics.incr('login.rejected.throttled_' + throttled)
+            flash('Too many login attempts. Please try again in a minute.', category='error')
+            return render_template('auth/login.html', form=form, title='Login'), 429
 
         # check whether user exists in the database and whether
         # the password entered matches the password in the database
         user = User.query.filter_by(email=form.email.data).first()
-        if user is not None and user.verify_password(form.password.data):
+        try:
+            verified = user is not None and login_guard.verify(user, form.password.data)
+        except LoginBusy:
+            metrics.incr('login.rejected.busy')
+            flash('The server is busy. Please try again in a moment.', category='error')
+            return render_template('auth/login.html', form=form, title='Login'), 503
+        finally:
+            metrics.record('login verification', ((time.time() - started) * 1000, 0.0, 0.0, 0))
+
+        if verified:
+            password_hash = login_guard.rehash(user, form.password.data)
+            if password_hash is not None:
+                user.password_hash = password_hash
+                db.session.commit()
+                metrics.incr('login.rehashed')
+
+            metrics.incr('login.succeeded')
             login_user(user)
 
             flash('You have successfully logged in.', category='message')
@@ -31,6 +59,7 @@ def login():
 
         # when login details are incorrect
         else:
+            metrics.incr('login.failed')
             flash("Invalid email or password.",category='error')
 
     return render_template('auth/login.html', form=form, title='Login')
@@ -39,6 +68,7 @@ def login():
 @auth.route('/logout')
 @login_required
 def logout():
+    user_cache.invalidate(current_user.id)
     logout_user()
     flash('You have successfully been logged out.', category='message')
 
@@ -0,0 +1,118 @@
+import threading
+import time
+
+from flask import abort, current_app
+from sqlalchemy.orm import Session
+
+from . import db
+
+
+class ReferenceCache(object):
+    """
+    In-process read-through cache for small reference tables
+    (roles, subjects, specializations, ...).
+
+    Rows are loaded once per model and kept detached from the session.
+    Every write to a cached table has to call invalidate(), which bumps
+    the version and drops the loaded rows of this process; other worker
+    processes reload them after REFERENCE_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self.version = 0
+
+    def _load(self, model):
+        # a private session keeps cached rows away from the request session
+        session = Session(bind=db.engine)
+        try:
+            rows = session.query(model).order_by(model.id).all()
+            session.expunge_all()
+        finally:
+            session.close()
+        return rows, dict((row.id, row) for row in rows)
+
+    def _entry(self, model):
+        now = time.time()
+        entry = self._rows.get(model)
+        if entry is None or entry[0] <= now:
+            version = self.version
+            rows, by_id = self._load(model)
+            entry = (now + current_app.config.get('REFERENCE_CACHE_TTL', 60), rows, by_id)
+            with self._lock:
+                # do not publish rows read before a concurrent invalidate()
+                if version == self.version:
+                    self._rows[model] = entry
+        return entry
+
+    def all(self, model):
+        """
+        All rows of the model ordered by id
+        """
+        return self._entry(model)[1]
+
+    def get(self, model, id):
+        """
+        One row of the model by primary key or None
+        """
+        return self._entry(model)[2].get(id)
+
+    def get_or_404(self, model, id):
+        """
+        One row of the model by primary key or abort with 404
+        """
+        row = self.get(model, id)
+        if row is None:
+            abort(404)
+        return row
+
+    def invalidate(self, model=None):
+        """
+        Drop cached rows of one model (or of all models) after a write
+        """
+        with self._lock:
+            self.version += 1
+            if model is None:
+                self._rows.clear()
+            else:
+                self._rows.pop(model, None)
+
+
+reference_cache = ReferenceCache()
+
+
+class UserCache(object):
+    """
+    In-process cache of logged-in user snapshots for the login manager.
+
+    Entries live for USER_CACHE_TTL seconds; admin views that change or
+    delete a user call invalidate() so the next request reloads it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}
+
+    def get(self, user_id, loader):
+        now = time.time()
+        entry = self._users.get(user_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        user = loader(user_id)
+        if user is not None:
+            ttl = current_app.config.get('USER_CACHE_TTL', 300)
+            with self._lock:
+                self._users[user_id] = (now + ttl, user)
+        return user
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+
+user_cache = UserCache()
@@ -0,0 +1,85 @@
+from collections import namedtuple
+
+from sqlalchemy import func, literal, or_, union_all
+from sqlalchemy.orm import aliased
+
+from . import db
+from .models import Schedule, EducationPlan, TeacherToSubject
+
+Conflict = namedtuple('Conflict', ['kind', 'plan_id', 'key', 'count'])
+
+# flash text when the unique constraints catch a booking find_conflicts() missed
+BOOKED = 'the class or the classroom was booked in this slot at the same time'
+
+KINDS = {
+    'class': 'Class',
+    'teacher': 'Teacher',
+    'classroom': 'Classroom',
+}
+
+
+def find_conflicts(plan_id, class_id, classroom_id, teacher_subject_id, exclude_id=None):
+    """
+    Lessons in the same plan slot that already use the class, the classroom
+    or the teacher behind teacher_subject_id, in one query.
+    Returns a list of (kind, schedule) pairs
+    """
+    link = aliased(TeacherToSubject)
+    teacher = db.session.query(link.user_id_teacher) \
+        .filter(link.id == teacher_subject_id) \
+        .as_scalar()
+
+    query = db.session.query(Schedule, TeacherToSubject.user_id_teacher, teacher) \
+        .outerjoin(TeacherToSubject, TeacherToSubject.id == Schedule.teacher_subject_id) \
+        .filter(Schedule.educationPlan_id == plan_id,
+                or_(Schedule.class_id == class_id,
+                    Schedule.classroom_id == classroom_id,
+                    TeacherToSubject.user_id_teacher == teacher))
+    if exclude_id is not None:
+        query = query.filter(Schedule.id != exclude_id)
+
+    conflicts = []
+    for schedule, schedule_teacher, new_teacher in query:
+        if schedule.class_id == class_id:
+            conflicts.append(('class', schedule))
+        if schedule.classroom_id == classroom_id:
+            conflicts.append(('classroom', schedule))
+        if schedule_teacher is not None and schedule_teacher == new_teacher:
+            conflicts.append(('teacher', schedule))
+    return conflicts
+
+
+def audit_semester(year, semester):
+    """
+    Every double booking of a class, teacher or classroom in a year/semester,
+    aggregated in a single pass over its schedules
+    """
+    base = db.session.query(Schedule.educationPlan_id.label('plan_id'),
+                            Schedule.class_id.label('class_id'),
+                            Schedule.classroom_id.label('classroom_id'),
+                            TeacherToSubject.user_id_teacher.label('teacher_id')) \
+        .join(EducationPlan, EducationPlan.id == Schedule.educationPlan_id) \
+        .outerjoin(TeacherToSubject, TeacherToSubject.id == Schedule.teacher_subject_id) \
+        .filter(EducationPlan.year == year, EducationPlan.semester == semester) \
+        .subquery()
+
+    def grouped(kind, column):
+        return db.session.query(literal(kind).label('kind'), base.c.plan_id, column.label('key'),
+                                func.count().label('count')) \
+            .filter(column.isnot(None)) \
+            .group_by(base.c.plan_id, column) \
+            .having(func.count() > 1)
+
+    statement = union_all(grouped('class', base.c.class_id).statement,
+                          grouped('teacher', base.c.teacher_id).statement,
+                          grouped('classroom', base.c.classroom_id).statement)
+
+    return sorted(Conflict(*row) for row in db.session.execute(statement))
+
+
+def conflicts_message(conflicts):
+    """
+    Human readable summary of find_conflicts() for flash messages
+    """
+    return ', '.join('{} is already booked ({})'.format(KINDS[kind], schedule.education_plan)
+                     for kind, schedule in conflicts)
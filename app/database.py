@@ -0,0 +1,166 @@
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, render_template, request, session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA = 'replica'
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session that reads from the replica bind while the request allows it
+    (see replica_reads). Flushes and Core insert/update/delete statements
+    always go to the primary
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase) or not _reading_replica():
+            return SignallingSession.get_bind(self, mapper, clause)
+        return get_state(self.app).db.get_engine(self.app, bind=REPLICA)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    # whatever the request reads after its own write must see it
+    if has_request_context():
+        g.db_wrote = True
+        g.use_replica = False
+
+
+def _reading_replica():
+    return has_request_context() and g.get('use_replica', False)
+
+
+def replica_reads(view):
+    """
+    Mark a read-only view whose GET requests may be served from the replica
+    """
+    view.replica_reads = True
+    return view
+
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary inside the block, e.g. before caching the result
+    """
+    previous = g.get('use_replica', False)
+    g.use_replica = False
+    try:
+        yield
+    finally:
+        g.use_replica = previous
+
+
+def engine_options(config):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS built from the DATABASE_* settings.
+
+    Behind PgBouncer in transaction mode the pooling is PgBouncer's job,
+    so the application keeps no connections of its own
+    """
+    options = {'pool_pre_ping': config.get('DATABASE_POOL_PRE_PING', True)}
+
+    if config.get('DATABASE_PGBOUNCER'):
+        options['poolclass'] = NullPool
+    elif not config.get('SQLALCHEMY_DATABASE_URI', '').startswith('sqlite'):
+        options.update(pool_size=config.get('DATABASE_POOL_SIZE', 5),
+                       max_overflow=config.get('DATABASE_MAX_OVERFLOW', 10),
+                       pool_timeout=config.get('DATABASE_POOL_TIMEOUT', 30),
+                       pool_recycle=config.get('DATABASE_POOL_RECYCLE', 1800))
+    return options
+
+
+def configure_database(app):
+    """
+    Fill the SQLAlchemy settings from DATABASE_* before db.init_app()
+    """
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+
+    replica = app.config.get('DATABASE_REPLICA_URI')
+    if replica:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA, replica)
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def _route_request():
+    view = current_app.view_functions.get(request.endpoint)
+    g.use_replica = REPLICA in (current_app.config.get('SQLALCHEMY_BINDS') or {}) \
+        and request.method in SAFE_METHODS \
+        and getattr(view, 'replica_reads', False) \
+        and session.get('primary_until', 0) < time.time()
+
+
+def _remember_write(response):
+    # the replica may lag behind this user's own write for a while
+    if (request.method not in SAFE_METHODS or g.get('db_wrote')) and response.status_code < 400:
+        session['primary_until'] = time.time() + current_app.config.get('DATABASE_REPLICA_LAG', 10)
+    return response
+
+
+def init_routing(app):
+    """
+    Send replica_reads GET requests to the replica bind, and the user's
+    requests right after a write back to the primary
+    """
+    app.before_request(_route_request)
+    app.after_request(_remember_write)
+
+
+def _session_settings(engine, statement_timeout, read_only):
+    @event.listens_for(engine, 'connect')
+    def set_session(dbapi_connection, connection_record):
+        # SET is transactional: in the transaction psycopg2 opens it would be
+        # undone by the pool's rollback when the connection is returned
+        autocommit = dbapi_connection.autocommit
+        dbapi_connection.autocommit = True
+        try:
+            cursor = dbapi_connection.cursor()
+            if statement_timeout:
+                cursor.execute('SET statement_timeout = %d' % int(statement_timeout))
+            if read_only:
+                cursor.execute('SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY')
+            cursor.close()
+        finally:
+            dbapi_connection.autocommit = autocommit
+
+
+def init_engines(app, db, metrics):
+    """
+    Per-connection settings and pool stats for the primary and every bind.
+
+    With PgBouncer a session-level SET would leak to other clients of the
+    same server connection, so the statement timeout belongs on the
+    database role there
+    """
+    with app.app_context():
+        engines = {'primary': db.get_engine(app)}
+        for bind in app.config.get('SQLALCHEMY_BINDS') or {}:
+            engines[bind] = db.get_engine(app, bind=bind)
+
+    pgbouncer = app.config.get('DATABASE_PGBOUNCER')
+    for name, engine in engines.items():
+        if engine.dialect.name == 'postgresql' and not pgbouncer:
+            _session_settings(engine, app.config.get('DATABASE_STATEMENT_TIMEOUT'), name == REPLICA)
+        metrics.watch_pool(name, engine)
+
+    @app.errorhandler(TimeoutError)
+    def pool_timeout(error):
+        # no connection was free within DATABASE_POOL_TIMEOUT
+        metrics.incr('pool.timeouts')
+        return render_template('errors/500.html', title='Server Error'), 503
+
+    return engines
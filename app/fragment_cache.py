@@ -0,0 +1,252 @@
+import fcntl
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, render_template, request, before_render_template, template_rendered
+from flask_login import current_user
+from markupsafe import Markup
+
+from .database import primary_reads
+
+
+class MemoryBackend(object):
+    """
+    In-process LRU store; fine for a single worker process.
+    Entries set without a ttl (namespace generations) are never evicted
+    """
+
+    def __init__(self, max_entries=1000):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._pinned = {}
+        self.max_entries = max_entries
+
+    def get(self, key):
+        with self._lock:
+            if key in self._pinned:
+                return self._pinned[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        expires, value = entry
+        if expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            if not ttl:
+                self._pinned[key] = value
+                return
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key):
+        """
+        Add one to a pinned counter atomically
+        """
+        with self._lock:
+            self._pinned[key] = self._pinned.get(key, 0) + 1
+            return self._pinned[key]
+
+    def delete(self, key):
+        with self._lock:
+            self._pinned.pop(key, None)
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._pinned.clear()
+            self._entries.clear()
+
+
+class DiskBackend(object):
+    """
+    Local on-disk store shared by every worker process on the host
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as entry:
+                expires, value = pickle.load(entry)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires is not None and expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        handle, path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, 'wb') as entry:
+            pickle.dump((time.time() + ttl if ttl else None, value), entry, pickle.HIGHEST_PROTOCOL)
+        os.rename(path, self._path(key))
+
+    def incr(self, key):
+        """
+        Add one to a counter; an exclusive lock file serializes every
+        worker process, so no increment is lost
+        """
+        with open(os.path.join(self.directory, 'incr.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                value = (self.get(key) or 0) + 1
+                self.set(key, value)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return value
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+
+def viewer_role():
+    """
+    What a page may differ by for the viewer: role id and admin flag, or
+    anonymous. Views choose templates by either of them
+    """
+    if not current_user.is_authenticated:
+        return 'anonymous'
+    return 'role{}{}'.format(current_user.role_id, '-admin' if current_user.is_admin else '')
+
+
+def render_block(template_name, block='body', **context):
+    """
+    Render one block of a template, without the base layout around it.
+    Sends the render signals like render_template(), for the metrics
+    """
+    app = current_app._get_current_object()
+    template = app.jinja_env.get_template(template_name)
+    app.update_template_context(context)
+    before_render_template.send(app, template=template, context=context)
+    rendered = u''.join(template.blocks[block](template.new_context(context)))
+    template_rendered.send(app, template=template, context=context)
+    return rendered
+
+
+class PageCache(object):
+    """
+    Cache of rendered page fragments keyed by endpoint, view arguments and
+    viewer role.
+
+    Every fragment belongs to namespaces ('schedule', 'classes', 'teachers').
+    Admin views that change those tables call invalidate(), which bumps the
+    namespace generation stored in the backend itself, so a disk backend
+    invalidates every worker at once.
+    """
+
+    NAMESPACES = ('schedule', 'classes', 'teachers')
+
+    def __init__(self, app=None, metrics=None):
+        self.backend = None
+        self.ttl = 300
+        self.metrics = None
+        if app is not None:
+            self.init_app(app, metrics)
+
+    def init_app(self, app, metrics=None):
+        self.metrics = metrics
+        backend = app.config.get('PAGE_CACHE_BACKEND')
+        self.ttl = app.config.get('PAGE_CACHE_TTL', 300)
+        if backend == 'memory':
+            self.backend = MemoryBackend(app.config.get('PAGE_CACHE_SIZE', 1000))
+        elif backend == 'disk':
+            self.backend = DiskBackend(app.config.get('PAGE_CACHE_DIR') or
+                                       os.path.join(app.instance_path, 'page_cache'))
+        else:
+            self.backend = None
+
+    def _generation(self, namespace):
+        return self.backend.get('generation:' + namespace) or 0
+
+    def _key(self, namespaces):
+        generations = ','.join('{}={}'.format(namespace, self._generation(namespace)) for namespace in namespaces)
+        view_args = ','.join('{}={}'.format(name, value) for name, value in sorted((request.view_args or {}).items()))
+        return 'page:{}:{}:{}:{}'.format(request.endpoint, view_args, viewer_role(), generations)
+
+    def fragment(self, namespaces, render):
+        """
+        Cached result of render() for the current request and viewer
+        """
+        if self.backend is None:
+            return render()
+
+        key = self._key(namespaces)
+        value = self.backend.get(key)
+        if value is not None:
+            self._count('hits')
+            return value
+
+        self._count('misses')
+        # a lagging replica must not end up in the cache for the whole ttl
+        with primary_reads():
+            value = render()
+        self.backend.set(key, value, self.ttl)
+        return value
+
+    def render_page(self, namespaces, render, **context):
+        """
+        Page whose body comes from the cache. The layout around it greets
+        the current user, so it is rendered on every request
+        """
+        return render_template('page_fragment.html', fragment=Markup(self.fragment(namespaces, render)), **context)
+
+    def invalidate(self, *namespaces):
+        """
+        Drop every fragment of the namespaces (all of them when none given)
+        """
+        if self.backend is None:
+            return
+        for namespace in namespaces or self.NAMESPACES:
+            self.backend.incr('generation:' + namespace)
+
+    def _count(self, outcome):
+        if self.metrics is not None:
+            self.metrics.incr('page_cache.' + outcome)
+            self.metrics.incr('page_cache.{}.{}'.format(request.endpoint, outcome))
+
+    def hit_ratios(self):
+        """
+        Hit ratio overall and per endpoint, from the metrics counters
+        """
+        if self.metrics is None:
+            return []
+
+        counts = {}
+        for name, value in list(self.metrics.counters.items()):
+            if name.startswith('page_cache.'):
+                scope, outcome = name[len('page_cache.'):].rpartition('.')[::2]
+                counts.setdefault(scope or 'all', {})[outcome] = value
+
+        ratios = []
+        for scope, count in sorted(counts.items()):
+            hits, misses = count.get('hits', 0), count.get('misses', 0)
+            ratios.append((scope, hits, misses, float(hits) / (hits + misses) if hits + misses else 0.0))
+        return ratios
@@ -0,0 +1,5 @@
+from flask import Blueprint
+
+grades = Blueprint('grades', __name__)
+
+from . import views
@@ -0,0 +1,31 @@
+from flask_wtf import FlaskForm
+from flask_wtf.file import FileField
+from wtforms import SubmitField
+from wtforms.ext.sqlalchemy.fields import QuerySelectField
+
+from ..cache import reference_cache
+from ..models import TypeOfWork
+
+
+class LessonGradesForm(FlaskForm):
+    """
+    Form for a teacher to grade a whole class for one lesson.
+    Grades themselves come as grade-<student id> inputs
+    """
+    type_of_work = QuerySelectField(query_factory=lambda: reference_cache.all(TypeOfWork), get_label="name")
+    submit = SubmitField('Save grades')
+
+
+class GradesImportForm(FlaskForm):
+    """
+    Form for admin to upload a CSV file with grades
+    """
+    file = FileField('CSV file: student_id, schedule_id, typeOfWork_id, grade')
+    submit = SubmitField('Import')
+
+
+class ReportCardsForm(FlaskForm):
+    """
+    Form for admin to start writing report cards
+    """
+    submit = SubmitField('Generate report cards')
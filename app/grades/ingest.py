@@ -0,0 +1,145 @@
+import csv
+import io
+from collections import namedtuple
+from itertools import islice
+
+from .. import db
+from ..cache import reference_cache
+from ..models import Grade, Schedule, StudentInClass, TypeOfWork
+from .rollups import grades_added, grades_removed
+
+MIN_GRADE = 1
+MAX_GRADE = 12
+BATCH_SIZE = 1000
+# rows per INSERT statement, under SQLite's 999 bound parameters
+INSERT_ROWS = 200
+
+GradeRow = namedtuple('GradeRow', ['student_id', 'schedule_id', 'typeOfWork_id', 'grade'])
+
+
+class ImportResult(object):
+    """
+    Counts and per-row errors of a grades import
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.errors = []
+
+    def to_dict(self):
+        return {'inserted': self.inserted,
+                'errors': [{'row': number, 'error': error} for number, error in self.errors]}
+
+
+def parse_row(data):
+    """
+    GradeRow from a CSV/JSON mapping; raises ValueError on bad input
+    """
+    try:
+        row = GradeRow(int(data['student_id']), int(data['schedule_id']),
+                       int(data['typeOfWork_id']), int(data['grade']))
+    except KeyError as error:
+        raise ValueError('missing field {}'.format(error))
+    except (TypeError, ValueError):
+        raise ValueError('fields must be integers')
+
+    if not MIN_GRADE <= row.grade <= MAX_GRADE:
+        raise ValueError('grade must be between {} and {}'.format(MIN_GRADE, MAX_GRADE))
+    return row
+
+
+def validate_batch(rows):
+    """
+    Split a batch into valid rows and (row, error) pairs with two queries:
+    the schedules' classes and the students enrolled in them
+    """
+    schedule_classes = dict(db.session.query(Schedule.id, Schedule.class_id)
+                            .filter(Schedule.id.in_(set(row.schedule_id for row in rows))))
+    enrolled = set(db.session.query(StudentInClass.class_id, StudentInClass.user_id_studen)
+                   .filter(StudentInClass.class_id.in_(set(schedule_classes.values())),
+                           StudentInClass.user_id_studen.in_(set(row.student_id for row in rows))))
+
+    valid = []
+    errors = []
+    for row in rows:
+        class_id = schedule_classes.get(row.schedule_id)
+        if class_id is None:
+            errors.append((row, 'unknown schedule {}'.format(row.schedule_id)))
+        elif reference_cache.get(TypeOfWork, row.typeOfWork_id) is None:
+            errors.append((row, 'unknown type of work {}'.format(row.typeOfWork_id)))
+        elif (class_id, row.student_id) not in enrolled:
+            errors.append((row, 'student {} is not in the class of schedule {}'.format(row.student_id,
+                                                                                       row.schedule_id)))
+        else:
+            valid.append(row)
+    return valid, errors
+
+
+def save_grades(rows):
+    """
+    Insert grades with multi-row inserts and update the rollups;
+    the caller commits. Every grade write goes through here or
+    replace_lesson_grades()
+    """
+    if rows:
+        for start in range(0, len(rows), INSERT_ROWS):
+            db.session.execute(Grade.__table__.insert()
+                               .values([row._asdict() for row in rows[start:start + INSERT_ROWS]]))
+        grades_added([(row.student_id, row.schedule_id, row.grade) for row in rows])
+    return len(rows)
+
+
+def replace_lesson_grades(schedule_id, type_of_work_id, grades):
+    """
+    Store one lesson's grades of a type of work for many students at once.
+    grades maps student id to grade; older grades of those students are replaced
+    """
+    rows = [GradeRow(student_id, schedule_id, type_of_work_id, grade) for student_id, grade in grades.items()]
+    if not rows:
+        return 0
+
+    replaced = Grade.query.filter(Grade.schedule_id == schedule_id,
+                                  Grade.typeOfWork_id == type_of_work_id,
+                                  Grade.student_id.in_(list(grades)))
+    grades_removed(replaced.with_entities(Grade.student_id, Grade.schedule_id, Grade.grade).all())
+    replaced.delete(synchronize_session=False)
+    return save_grades(rows)
+
+
+def import_grades(records, batch_size=BATCH_SIZE):
+    """
+    Validate and insert an iterable of mappings batch by batch in one transaction
+    """
+    result = ImportResult()
+    records = enumerate(records, 1)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+
+        rows = []
+        numbers = {}
+        for number, data in batch:
+            try:
+                row = parse_row(data)
+            except ValueError as error:
+                result.errors.append((number, str(error)))
+                continue
+            rows.append(row)
+            numbers.setdefault(row, []).append(number)
+
+        valid, errors = validate_batch(rows)
+        for row, error in errors:
+            result.errors.append((numbers[row].pop(0), error))
+        result.inserted += save_grades(valid)
+
+    db.session.commit()
+    result.errors.sort()
+    return result
+
+
+def csv_records(stream):
+    """
+    Rows of an uploaded CSV file, read lazily
+    """
+    return csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8'))
@@ -0,0 +1,116 @@
+import io
+import os
+import re
+from collections import defaultdict
+from multiprocessing import Pool, cpu_count
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from .. import db
+from ..cache import reference_cache
+from ..models import Class, GradeRollup, ParentToStudent, StudentInClass, Subject, User
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates', 'grades')
+TEMPLATE_NAME = 'report_card.html'
+
+# compiled once per worker process by _init_worker()
+_template = None
+
+
+def _init_worker(template_dir):
+    global _template
+    environment = Environment(loader=FileSystemLoader(template_dir), autoescape=select_autoescape(['html']))
+    _template = environment.get_template(TEMPLATE_NAME)
+
+
+def _file_name(text):
+    return re.sub(r'[^\w.-]+', '_', text, flags=re.UNICODE).strip('_') or 'unnamed'
+
+
+def render_class(task):
+    """
+    Write the report cards of one class; runs in a worker process
+    """
+    output_dir, payload = task
+    class_dir = os.path.join(output_dir, _file_name(payload['class_name']))
+    if not os.path.isdir(class_dir):
+        os.makedirs(class_dir)
+
+    for student in payload['students']:
+        path = os.path.join(class_dir, '{}-{}.html'.format(student['id'], _file_name(student['name'])))
+        with io.open(path, 'w', encoding='utf-8') as report_card:
+            report_card.write(_template.render(school_class=payload['class_name'],
+                                               year=payload['year'],
+                                               semester=payload['semester'],
+                                               student=student))
+    return len(payload['students'])
+
+
+def collect(year, semester, class_ids=None):
+    """
+    Plain, picklable report card data for every class, fetched with one
+    query for the students, one for their rollups and one for their parents
+    """
+    classes = Class.query.order_by(Class.name)
+    if class_ids is not None:
+        classes = classes.filter(Class.id.in_(class_ids))
+    classes = classes.all()
+    if not classes:
+        return []
+
+    students = db.session.query(StudentInClass.class_id, User) \
+        .join(User, User.id == StudentInClass.user_id_studen) \
+        .filter(StudentInClass.class_id.in_([school_class.id for school_class in classes])) \
+        .order_by(User.last_name, User.first_name).all()
+    student_ids = [user.id for _, user in students]
+
+    subjects = defaultdict(list)
+    parents = defaultdict(list)
+    if student_ids:
+        for rollup in GradeRollup.query.filter(GradeRollup.scope == 'student',
+                                               GradeRollup.scope_id.in_(student_ids),
+                                               GradeRollup.year == year,
+                                               GradeRollup.semester == semester,
+                                               GradeRollup.count > 0):
+            subjects[rollup.scope_id].append({'subject': str(reference_cache.get(Subject, rollup.subject_id)),
+                                              'count': rollup.count,
+                                              'average': rollup.average})
+
+        for student_id, parent in db.session.query(ParentToStudent.user_id_student, User) \
+                .join(User, User.id == ParentToStudent.user_id_parent) \
+                .filter(ParentToStudent.user_id_student.in_(student_ids)):
+            parents[student_id].append(parent.fullname)
+
+    by_class = defaultdict(list)
+    for class_id, user in students:
+        by_class[class_id].append({'id': user.id,
+                                   'name': user.fullname,
+                                   'parents': parents[user.id],
+                                   'subjects': sorted(subjects[user.id], key=lambda item: item['subject'])})
+
+    return [{'class_name': school_class.name, 'year': year, 'semester': semester,
+             'students': by_class[school_class.id]} for school_class in classes]
+
+
+def generate_report_cards(output_dir, year, semester, class_ids=None, workers=None):
+    """
+    Render report cards for the chosen classes (or the whole school) into
+    output_dir, one class per task across a pool of worker processes.
+    Returns the number of written report cards
+    """
+    payloads = [payload for payload in collect(year, semester, class_ids) if payload['students']]
+    if not payloads:
+        return 0
+
+    tasks = [(output_dir, payload) for payload in payloads]
+    workers = min(workers or cpu_count(), len(tasks))
+    if workers <= 1:
+        _init_worker(TEMPLATE_DIR)
+        return sum(map(render_class, tasks))
+
+    pool = Pool(workers, initializer=_init_worker, initargs=(TEMPLATE_DIR,))
+    try:
+        return sum(pool.imap_unordered(render_class, tasks))
+    finally:
+        pool.close()
+        pool.join()
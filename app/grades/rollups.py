@@ -0,0 +1,184 @@
+from collections import defaultdict
+
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import EducationPlan, Grade, GradeRollup, Schedule, TeacherToSubject, User
+
+SCOPES = ('student', 'class', 'teacher')
+
+
+def lesson_keys(schedule_ids, session=None):
+    """
+    schedule id -> (class, teacher, subject, year, semester) in one query
+    """
+    if not schedule_ids:
+        return {}
+    rows = (session or db.session).query(Schedule.id, Schedule.class_id, TeacherToSubject.user_id_teacher,
+                            TeacherToSubject.subject_id, EducationPlan.year, EducationPlan.semester) \
+        .join(TeacherToSubject, TeacherToSubject.id == Schedule.teacher_subject_id) \
+        .join(EducationPlan, EducationPlan.id == Schedule.educationPlan_id) \
+        .filter(Schedule.id.in_(set(schedule_ids)))
+    return dict((row[0], row[1:]) for row in rows)
+
+
+def deltas(grades, sign=1, session=None):
+    """
+    Sum (student_id, schedule_id, grade) triples into per-rollup deltas
+    """
+    keys = lesson_keys(set(schedule_id for _, schedule_id, _ in grades), session)
+    changes = defaultdict(lambda: [0, 0, 0])
+    for student_id, schedule_id, grade in grades:
+        lesson = keys.get(schedule_id)
+        if lesson is None or student_id is None:
+            continue
+        class_id, teacher_id, subject_id, year, semester = lesson
+        for scope, scope_id in (('student', student_id), ('class', class_id), ('teacher', teacher_id)):
+            change = changes[(scope, scope_id, subject_id, year, semester)]
+            change[0] += sign
+            change[1] += sign * grade
+            change[2] += sign * grade * grade
+    return changes
+
+
+def apply_deltas(changes, session=None):
+    """
+    Add deltas to the rollups with Core statements only, so it also runs
+    inside flush events; the caller commits
+    """
+    if not changes:
+        return
+    session = session or db.session
+
+    rows = [{'scope': scope, 'scope_id': scope_id, 'subject_id': subject_id, 'year': year, 'semester': semester,
+             'count': count, 'total': total, 'total_squares': squares}
+            for (scope, scope_id, subject_id, year, semester), (count, total, squares) in changes.items()]
+
+    table = GradeRollup.__table__
+    if session.get_bind().dialect.name == 'postgresql':
+        statement = pg_insert(table).values(rows)
+        statement = statement.on_conflict_do_update(
+            constraint='_gradeRollupUnique',
+            set_={'count': table.c.count + statement.excluded.count,
+                  'total': table.c.total + statement.excluded.total,
+                  'total_squares': table.c.total_squares + statement.excluded.total_squares})
+        session.execute(statement)
+        return
+
+    missing = []
+    for row in rows:
+        updated = session.execute(table.update()
+                                  .where(table.c.scope == row['scope'])
+                                  .where(table.c.scope_id == row['scope_id'])
+                                  .where(table.c.subject_id == row['subject_id'])
+                                  .where(table.c.year == row['year'])
+                                  .where(table.c.semester == row['semester'])
+                                  .values(count=table.c.count + row['count'],
+                                          total=table.c.total + row['total'],
+                                          total_squares=table.c.total_squares + row['total_squares'])).rowcount
+        if not updated:
+            missing.append(row)
+    if missing:
+        session.execute(table.insert(), missing)
+
+
+def grades_added(grades, session=None):
+    apply_deltas(deltas(grades, session=session), session)
+
+
+def grades_removed(grades, session=None):
+    apply_deltas(deltas(grades, -1, session), session)
+
+
+# attributes that decide which rollups a lesson's grades count towards
+REKEYED = {
+    Schedule: ('class_id', 'teacher_subject_id', 'educationPlan_id'),
+    TeacherToSubject: ('user_id_teacher', 'subject_id'),
+    EducationPlan: ('year', 'semester'),
+}
+
+
+def _affected_grades(session):
+    """
+    Criteria for the grades whose rollup keys the pending flush changes:
+    lessons moved to another class, teacher, subject or semester, deleted
+    lessons, plans and teacher subjects, and deleted students or teachers
+    """
+    ids = defaultdict(set)
+    for instance in list(session.dirty) + list(session.deleted):
+        model = type(instance)
+        if model is User and instance in session.deleted:
+            ids[User].add(instance.id)
+        elif model in REKEYED and (instance in session.deleted or any(
+                inspect(instance).attrs[name].history.has_changes() for name in REKEYED[model])):
+            ids[model].add(instance.id)
+
+    criteria = []
+    if ids[Schedule]:
+        criteria.append(Grade.schedule_id.in_(ids[Schedule]))
+    if ids[EducationPlan]:
+        criteria.append(Grade.schedule_id.in_(
+            db.select([Schedule.id]).where(Schedule.educationPlan_id.in_(ids[EducationPlan]))))
+    if ids[TeacherToSubject]:
+        criteria.append(Grade.schedule_id.in_(
+            db.select([Schedule.id]).where(Schedule.teacher_subject_id.in_(ids[TeacherToSubject]))))
+    if ids[User]:
+        criteria.append(Grade.student_id.in_(ids[User]))
+        taught = db.select([TeacherToSubject.id]).where(TeacherToSubject.user_id_teacher.in_(ids[User]))
+        criteria.append(Grade.schedule_id.in_(
+            db.select([Schedule.id]).where(Schedule.teacher_subject_id.in_(taught))))
+    return criteria
+
+
+@event.listens_for(Session, 'before_flush')
+def _unroll_rekeyed_grades(session, flush_context, instances):
+    # the database still holds the old keys: take the grades out of them
+    session.info.pop('rekeyed_grades', None)
+    criteria = _affected_grades(session)
+    if not criteria:
+        return
+    grades = session.query(Grade.id, Grade.student_id, Grade.schedule_id, Grade.grade) \
+        .filter(or_(*criteria)).all()
+    if grades:
+        grades_removed([grade[1:] for grade in grades], session)
+        session.info['rekeyed_grades'] = [grade[0] for grade in grades]
+
+
+@event.listens_for(Session, 'after_flush')
+def _reroll_rekeyed_grades(session, flush_context):
+    # and count whatever is left of them under the new keys
+    grade_ids = session.info.pop('rekeyed_grades', None)
+    if grade_ids:
+        grades_added(session.query(Grade.student_id, Grade.schedule_id, Grade.grade)
+                     .filter(Grade.id.in_(grade_ids)).all(), session)
+
+
+def rebuild(year, semester):
+    """
+    Recompute the rollups of a year/semester from the grades table
+    """
+    schedule_ids = db.session.query(Schedule.id) \
+        .join(EducationPlan, EducationPlan.id == Schedule.educationPlan_id) \
+        .filter(EducationPlan.year == year, EducationPlan.semester == semester)
+
+    GradeRollup.query.filter_by(year=year, semester=semester).delete(synchronize_session=False)
+    grades = db.session.query(Grade.student_id, Grade.schedule_id, Grade.grade) \
+        .filter(Grade.schedule_id.in_(schedule_ids)).all()
+    grades_added(grades)
+    db.session.commit()
+    return len(grades)
+
+
+def report(scope, year, semester, scope_id=None):
+    """
+    Rollups of one scope for a year/semester, read without touching grades
+    """
+    query = GradeRollup.query.filter(GradeRollup.scope == scope,
+                                     GradeRollup.year == year,
+                                     GradeRollup.semester == semester,
+                                     GradeRollup.count > 0)
+    if scope_id is not None:
+        query = query.filter(GradeRollup.scope_id == scope_id)
+    return query.order_by(GradeRollup.scope_id, GradeRollup.subject_id).all()
@@ -0,0 +1,205 @@
+import os
+
+from flask import abort, current_app, flash, jsonify, redirect, render_template, request, url_for
+from flask_login import current_user, login_required
+
+from . import grades
+from .forms import GradesImportForm, LessonGradesForm, ReportCardsForm
+from .ingest import MAX_GRADE, MIN_GRADE, csv_records, import_grades, replace_lesson_grades
+from .rollups import report
+from .. import db
+from ..database import replica_reads
+from ..jobs import start_command
+from ..cache import reference_cache
+from ..models import Class, Grade, ParentToStudent, Schedule, StudentInClass, Subject, TeacherToSubject, User
+
+
+def check_admin():
+    """
+    Prevent non-admins from accessing the page
+    """
+    if not current_user.is_admin:
+        abort(403)
+
+
+def check_lesson_teacher(schedule):
+    """
+    Only the teacher of the lesson or an admin may grade it
+    """
+    if current_user.is_admin:
+        return
+    teacher_id = db.session.query(TeacherToSubject.user_id_teacher) \
+        .filter(TeacherToSubject.id == schedule.teacher_subject_id).scalar()
+    if teacher_id != current_user.id:
+        abort(403)
+
+
+@grades.route('/grades/lesson/<int:id_schedule>', methods=['GET', 'POST'])
+@login_required
+def lesson_grades(id_schedule):
+    """
+    Grade the whole class for one lesson
+    """
+    schedule = Schedule.query.get_or_404(id_schedule)
+    check_lesson_teacher(schedule)
+
+    students = User.query.join(StudentInClass, StudentInClass.user_id_studen == User.id) \
+        .filter(StudentInClass.class_id == schedule.class_id) \
+        .order_by(User.last_name, User.first_name).all()
+
+    form = LessonGradesForm()
+    if form.validate_on_submit():
+        values = {}
+        for student in students:
+            value = request.form.get('grade-{}'.format(student.id), '').strip()
+            if not value:
+                continue
+            try:
+                grade = int(value)
+            except ValueError:
+                grade = None
+            if grade is None or not MIN_GRADE <= grade <= MAX_GRADE:
+                flash('Grade of {} must be between {} and {}.'.format(student.fullname, MIN_GRADE, MAX_GRADE),
+                      category='error')
+                return redirect(url_for('grades.lesson_grades', id_schedule=id_schedule))
+            values[student.id] = grade
+
+        try:
+            saved = replace_lesson_grades(id_schedule, form.type_of_work.data.id, values)
+            db.session.commit()
+            flash('You have successfully saved {} grades.'.format(saved), category='message')
+        except:
+            db.session.rollback()
+            flash('Error in saving grades.', category='error')
+
+        return redirect(url_for('grades.lesson_grades', id_schedule=id_schedule))
+
+    lesson_grades = {}
+    for grade in Grade.query.filter_by(schedule_id=id_schedule).order_by(Grade.id):
+        lesson_grades.setdefault(grade.student_id, []).append(grade)
+
+    return render_template('grades/lesson.html',
+                           form=form,
+                           schedule=schedule,
+                           students=students,
+                           grades=lesson_grades,
+                           title='Grades')
+
+
+@grades.route('/grades/import', methods=['GET', 'POST'])
+@login_required
+def import_grades_file():
+    """
+    Bulk import of grades from a CSV upload or a JSON list
+    """
+    check_admin()
+
+    if request.is_json:
+        records = request.get_json()
+        if not isinstance(records, list):
+            abort(400)
+        try:
+            return jsonify(import_grades(records).to_dict())
+        except:
+            db.session.rollback()
+            abort(500)
+
+    form = GradesImportForm()
+    if form.validate_on_submit() and form.file.data:
+        try:
+            result = import_grades(csv_records(form.file.data.stream))
+            flash('You have successfully imported {} grades.'.format(result.inserted), category='message')
+            for number, error in result.errors[:20]:
+                flash('Row {}: {}'.format(number, error), category='error')
+            if len(result.errors) > 20:
+                flash('{} more rows with errors.'.format(len(result.errors) - 20), category='error')
+        except:
+            db.session.rollback()
+            flash('Error in importing grades.', category='error')
+
+        return redirect(url_for('grades.import_grades_file'))
+
+    return render_template('grades/import.html',
+                           form=form,
+                           title='Import grades')
+
+
+def _report_rows(rollups, names):
+    return [(names.get(rollup.scope_id, rollup.scope_id), reference_cache.get(Subject, rollup.subject_id), rollup)
+            for rollup in rollups]
+
+
+@grades.route('/grades/reports/<int:year>/<int:semester>')
+@login_required
+@replica_reads
+def grade_reports(year, semester):
+    """
+    Grade statistics per class and per teacher, read from the rollups
+    """
+    if not (current_user.is_admin or current_user.role_id == 1):
+        abort(403)
+
+    classes = report('class', year, semester)
+    teachers = report('teacher', year, semester)
+
+    class_names = dict(db.session.query(Class.id, Class.name)
+                       .filter(Class.id.in_(set(rollup.scope_id for rollup in classes))))
+    teacher_names = dict((user.id, user.fullname) for user in
+                         User.query.filter(User.id.in_(set(rollup.scope_id for rollup in teachers))))
+
+    return render_template('grades/reports.html',
+                           form=ReportCardsForm(),
+                           sections=[('Classes', _report_rows(classes, class_names)),
+                                     ('Teachers', _report_rows(teachers, teacher_names))],
+                           year=year,
+                           semester=semester,
+                           title='Grade reports')
+
+
+@grades.route('/grades/student/<int:id>/<int:year>/<int:semester>')
+@login_required
+@replica_reads
+def student_grade_report(id, year, semester):
+    """
+    Average grades of one student per subject, read from the rollups
+    """
+    if not (current_user.is_admin or current_user.role_id == 1 or current_user.id == id or
+            ParentToStudent.query.filter_by(user_id_parent=current_user.id, user_id_student=id).first()):
+        abort(403)
+
+    student = User.query.get_or_404(id)
+
+    return render_template('grades/reports.html',
+                           form=ReportCardsForm(),
+                           sections=[(student.fullname,
+                                      _report_rows(report('student', year, semester, id), {id: student.fullname}))],
+                           year=year,
+                           semester=semester,
+                           title='Grade report')
+
+
+@grades.route('/grades/report_cards/<int:year>/<int:semester>', methods=['POST'])
+@grades.route('/grades/report_cards/<int:year>/<int:semester>/<int:id_class>', methods=['POST'])
+@login_required
+def generate_class_report_cards(year, semester, id_class=None):
+    """
+    Start writing report cards of one class or of the whole school in
+    the background with "manage.py report_cards"
+    """
+    check_admin()
+
+    if not ReportCardsForm().validate_on_submit():
+        flash('Error in generating report cards.', category='error')
+        return redirect(url_for('grades.grade_reports', year=year, semester=semester))
+
+    output = current_app.config.get('REPORT_CARDS_DIR') or os.path.join(current_app.instance_path, 'report_cards')
+    args = ['-y', year, '-s', semester, '-o', output]
+    if id_class:
+        args += ['-c', Class.query.get_or_404(id_class).name]
+    try:
+        log = start_command('report_cards', *args)
+        flash('Report cards are being written to {}, progress in {}.'.format(output, log), category='message')
+    except:
+        flash('Error in generating report cards.', category='error')
+
+    return redirect(url_for('grades.grade_reports', year=year, semester=semester))
@@ -1,6 +1,11 @@
 from flask import abort, render_template, flash
 from flask_login import current_user, login_required
 
+from .. import page_cache
+from ..database import replica_reads
+from ..cache import reference_cache
+from ..fragment_cache import render_block
+from ..schedule.feeds import feed_token
 from ..models import Role, User, TeacherToSubject, ParentToStudent, TeachersClassroom, Class, StudentInClass
 
 from . import home
@@ -15,21 +20,21 @@ def check_admin():
 
 
 def check_student(role_id):
-    role = Role.query.get_or_404(role_id)
+    role = reference_cache.get_or_404(Role, role_id)
 
     if role.name != "Student":
         abort(403)
 
 
 def check_teacher(role_id):
-    role = Role.query.get_or_404(role_id)
+    role = reference_cache.get_or_404(Role, role_id)
 
     if role.name != "Teacher":
         abort(403)
 
 
 def check_parent(role_id):
-    role = Role.query.get_or_404(role_id)
+    role = reference_cache.get_or_404(Role, role_id)
 
     if role.name != "Parent":
         abort(403)
@@ -54,24 +59,27 @@ def admin_dashboard():
 
 @home.route('/class/<int:id>')
 @login_required
+@replica_reads
 def class_dashboard(id):
-    classStudents = StudentInClass.query.filter_by(class_id=id).all()
-    _class = Class.query.get_or_404(id)
+    def render():
+        classStudents = StudentInClass.query.filter_by(class_id=id).all()
+        _class = Class.query.get_or_404(id)
 
-    if current_user.role_id == 1 or current_user.role_id == 2:
-        return render_template('home/class_dashboard.html',
-                               title='Class',
-                               _class=_class,
-                               classStudents=classStudents)
-    else:
-        return render_template('home/class_dashboard_all.html',
-                               title='Class',
-                               _class=_class,
-                               classStudents=classStudents)
+        if current_user.role_id == 1 or current_user.role_id == 2:
+            template = 'home/class_dashboard.html'
+        else:
+            template = 'home/class_dashboard_all.html'
+        return render_block(template,
+                            _class=_class,
+                            classStudents=classStudents,
+                            feedToken=feed_token('class', id))
+
+    return page_cache.render_page(('classes',), render, title='Class')
 
 
 @home.route('/student/<int:id>')
 @login_required
+@replica_reads
 def student_dashboard(id):
     user = User.query.get_or_404(id)
 
@@ -95,33 +103,35 @@ def student_dashboard(id):
 
 @home.route('/teacher/<int:id>')
 @login_required
+@replica_reads
 def teacher_dashboard(id):
-    user = User.query.get_or_404(id)
+    def render():
+        user = User.query.get_or_404(id)
 
-    check_teacher(user.role_id)
+        check_teacher(user.role_id)
 
-    headClass = Class.query.filter_by(headTeacher=id).first()
+        headClass = Class.query.filter_by(headTeacher=id).first()
 
-    subjects = TeacherToSubject.query.filter_by(user_id_teacher=id).all()
+        subjects = TeacherToSubject.query.filter_by(user_id_teacher=id).all()
 
-    classroom = TeachersClassroom.query.filter_by(user_id_teacher=id).first()
+        classroom = TeachersClassroom.query.filter_by(user_id_teacher=id).first()
 
-    if current_user.role_id == 1 or current_user.is_admin:
-        return render_template('home/teacher_dashboard.html',
-                               user=user,
-                               headClass=headClass,
-                               subjects=subjects,
-                               classroom=classroom)
-    else:
-        return render_template('home/teacher_dashboard_all.html',
-                               user=user,
-                               headClass=headClass,
-                               subjects=subjects,
-                               classroom=classroom)
+        if current_user.role_id == 1 or current_user.is_admin:
+            template = 'home/teacher_dashboard.html'
+        else:
+            template = 'home/teacher_dashboard_all.html'
+        return render_block(template,
+                            user=user,
+                            headClass=headClass,
+                            subjects=subjects,
+                            classroom=classroom)
+
+    return page_cache.render_page(('teachers', 'classes'), render)
 
 
 @home.route('/parent/<int:id>')
 @login_required
+@replica_reads
 def parent_dashboard(id):
     user = User.query.get_or_404(id)
 
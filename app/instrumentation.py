@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import deque
+
+from flask import g, request, has_app_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not values:
+        return 0
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+class EndpointStats(object):
+    """
+    Last samples of one endpoint: (total ms, db ms, template ms, queries)
+    """
+
+    def __init__(self, size):
+        self.count = 0
+        self.samples = deque(maxlen=size)
+
+    def add(self, sample):
+        self.count += 1
+        self.samples.append(sample)
+
+    def summary(self):
+        totals = sorted(sample[0] for sample in self.samples)
+        samples = len(self.samples) or 1
+        return {
+            'count': self.count,
+            'p50': percentile(totals, 50),
+            'p95': percentile(totals, 95),
+            'p99': percentile(totals, 99),
+            'db': sum(sample[1] for sample in self.samples) / samples,
+            'template': sum(sample[2] for sample in self.samples) / samples,
+            'queries': float(sum(sample[3] for sample in self.samples)) / samples,
+        }
+
+
+class PoolStats(object):
+    """
+    Connection pool activity of one engine
+    """
+
+    def __init__(self, engine):
+        self._lock = threading.Lock()
+        self.pool = engine.pool
+        self.connects = 0
+        self.checkouts = 0
+        self.invalidated = 0
+        self.checked_out = 0
+        self.peak = 0
+        event.listen(engine, 'connect', self._connect)
+        event.listen(engine, 'checkout', self._checkout)
+        event.listen(engine, 'checkin', self._checkin)
+        event.listen(engine, 'invalidate', self._invalidate)
+
+    def _connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak = max(self.peak, self.checked_out)
+
+    def _checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out -= 1
+
+    def _invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidated += 1
+
+    def summary(self):
+        size = getattr(self.pool, 'size', None)
+        overflow = getattr(self.pool, '_max_overflow', None)
+        return {
+            'size': size() if callable(size) else None,
+            'max_overflow': overflow,
+            'checked_out': self.checked_out,
+            'peak': self.peak,
+            'checkouts': self.checkouts,
+            'connects': self.connects,
+            'invalidated': self.invalidated,
+        }
+
+
+class Metrics(object):
+    """
+    Per-request query count, database time, template render time and
+    total latency.
+
+    Numbers are sent back in a Server-Timing header and kept per endpoint
+    for the /admin/metrics page.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.counters = {}
+        self.pools = {}
+        self.sample_size = 1000
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sample_size = app.config.get('METRICS_SAMPLE_SIZE', 1000)
+
+        if not event.contains(Engine, 'before_cursor_execute', self._before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(Engine, 'handle_error', self._handle_error)
+        before_render_template.connect(self._before_render_template, app)
+        template_rendered.connect(self._template_rendered, app)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        g.metrics_start = time.time()
+        g.metrics_queries = 0
+        g.metrics_db = 0.0
+        g.metrics_template = 0.0
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.time())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self._query_done(conn.info['metrics_query_start'].pop())
+
+    def _query_done(self, started):
+        if has_app_context() and 'metrics_start' in g:
+            g.metrics_queries += 1
+            g.metrics_db += time.time() - started
+
+    def _handle_error(self, context):
+        # a failed statement never reaches after_cursor_execute
+        if context.connection is not None and context.cursor is not None:
+            starts = context.connection.info.get('metrics_query_start')
+            if starts:
+                self._query_done(starts.pop())
+
+    def _before_render_template(self, sender, template, context, **extra):
+        if 'metrics_start' in g:
+            g.metrics_template_start = time.time()
+
+    def _template_rendered(self, sender, template, context, **extra):
+        if 'metrics_template_start' in g:
+            g.metrics_template += time.time() - g.pop('metrics_template_start')
+
+    def _sample(self):
+        return ((time.time() - g.metrics_start) * 1000, g.metrics_db * 1000, g.metrics_template * 1000,
+                g.metrics_queries)
+
+    def _after_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+
+        total, db_time, template, queries = self._sample()
+        response.headers['Server-Timing'] = 'db;dur={:.1f};desc="{} queries", ' \
+                                            'tpl;dur={:.1f}, total;dur={:.1f}'.format(db_time, queries,
+                                                                                      template, total)
+        return response
+
+    def _teardown_request(self, exception=None):
+        # runs for requests that ended in an error too, unlike after_request
+        if 'metrics_start' in g:
+            self.record(request.endpoint or 'unknown', self._sample())
+            g.pop('metrics_start')
+
+    def record(self, endpoint, sample):
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats(self.sample_size)
+            stats.add(sample)
+
+    def incr(self, name, value=1):
+        """
+        Bump a named counter shown on the metrics page
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def watch_pool(self, name, engine):
+        """
+        Count checkouts, new connections and the peak of busy connections
+        """
+        self.pools[name] = PoolStats(engine)
+
+    def summary(self):
+        with self._lock:
+            return sorted((endpoint, stats.summary()) for endpoint, stats in self.endpoints.items())
+
+    def pool_summary(self):
+        return sorted((name, stats.summary()) for name, stats in self.pools.items())
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+import time
+
+from flask import current_app
+
+MANAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'manage.py')
+
+
+def jobs_dir():
+    """
+    JOBS_DIR, <instance>/jobs when empty; job inputs and logs go there
+    """
+    directory = current_app.config.get('JOBS_DIR') or os.path.join(current_app.instance_path, 'jobs')
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return directory
+
+
+def job_path(name, extension):
+    return os.path.join(jobs_dir(), '{}-{}{}'.format(name, time.strftime('%Y%m%d-%H%M%S'), extension))
+
+
+def start_command(name, *args):
+    """
+    Run a manage.py command in its own process and return at once, so
+    process pools are never forked from a threaded web worker. Returns
+    the log file the command writes to
+    """
+    log_path = job_path(name, '.log')
+    with open(log_path, 'ab') as log:
+        subprocess.Popen([sys.executable, MANAGE, name] + [str(arg) for arg in args],
+                         stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                         close_fds=True, start_new_session=True)
+    return log_path
@@ -0,0 +1,166 @@
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, build_opener
+
+from . import db
+from .instrumentation import percentile
+from .models import Class, User, TeacherToSubject
+from .seed import EMAIL_DOMAIN
+
+CSRF = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+ADMIN_LISTS = ['/admin/users/1', '/admin/classrooms/1', '/admin/teachers/list/1',
+               '/admin/students_class/1', '/admin/parent_to_student/1', '/admin/subjects/1', '/admin/plans/1']
+
+
+class Client(object):
+    """
+    One simulated browser with its own cookies, timing every request
+    """
+
+    def __init__(self, base_url, results):
+        self.base_url = base_url.rstrip('/')
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+        self.results = results
+
+    def request(self, label, path, data=None):
+        started = time.time()
+        try:
+            response = self.opener.open(self.base_url + path, urlencode(data).encode('utf-8') if data else None)
+            body = response.read().decode('utf-8', 'replace')
+            url = response.geturl()
+            # a page that bounces to the login form was not served
+            ok = path == '/login' or not url.endswith('/login')
+        except (HTTPError, URLError):
+            body, url, ok = '', '', False
+        self.results.add(label, (time.time() - started) * 1000, ok)
+        return body, url, ok
+
+    def get(self, label, path):
+        return self.request(label, path)[0]
+
+    def login(self, email, password):
+        page, url, ok = self.request('login form', '/login')
+        match = CSRF.search(page)
+        data = {'email': email, 'password': password}
+        if match:
+            data['csrf_token'] = match.group(1)
+        page, url, ok = self.request('login', '/login', data)
+        # a rejected login either fails or lands back on the form
+        return ok and not url.endswith('/login')
+
+
+class Results(object):
+    """
+    Latencies and failures per request label
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, label, milliseconds, ok):
+        with self._lock:
+            self.latencies[label].append(milliseconds)
+            if not ok:
+                self.errors[label] += 1
+
+    def report(self, seconds):
+        lines = ['{:<20} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9}'.format('request', 'count', 'errors', 'req/s',
+                                                                      'p50, ms', 'p95, ms', 'p99, ms')]
+        total = 0
+        for label, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            total += len(values)
+            lines.append('{:<20} {:>8} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+                label, len(values), self.errors[label], len(values) / seconds,
+                percentile(values, 50), percentile(values, 95), percentile(values, 99)))
+        lines.append('{} requests in {:.1f}s, {:.1f} req/s'.format(total, seconds, total / seconds))
+        return '\n'.join(lines)
+
+
+class Context(object):
+    """
+    Seeded accounts and ids the scenarios pick from, read once from the database
+    """
+
+    def __init__(self, password, sample=200):
+        def emails(**filters):
+            return [email for email, in db.session.query(User.email)
+                                                  .filter(User.email.like('%@' + EMAIL_DOMAIN))
+                                                  .filter_by(**filters).limit(sample)]
+
+        self.password = password
+        self.students = emails(role_id=2, is_admin=False)
+        self.parents = emails(role_id=3, is_admin=False)
+        self.teachers = emails(role_id=1, is_admin=False)
+        self.admins = emails(is_admin=True)
+        self.class_ids = [class_id for class_id, in db.session.query(Class.id).limit(sample)]
+        self.teacher_ids = [teacher_id for teacher_id, in db.session.query(TeacherToSubject.user_id_teacher)
+                                                                    .distinct().limit(sample)]
+        if not (self.students and self.teachers and self.class_ids):
+            raise ValueError('No seeded school found, run "manage.py seed" first')
+
+
+def scenario_login(client, context, rand):
+    client.login(rand.choice(context.students + context.parents + context.teachers), context.password)
+
+
+def scenario_timetable(client, context, rand):
+    if client.login(rand.choice(context.students), context.password):
+        for day in range(1, 7):
+            client.get('class timetable', '/schedule/class/{}/day/{}'.format(rand.choice(context.class_ids), day))
+
+
+def scenario_dashboards(client, context, rand):
+    if client.login(rand.choice(context.teachers), context.password):
+        client.get('class dashboard', '/class/{}'.format(rand.choice(context.class_ids)))
+        client.get('teacher dashboard', '/teacher/{}'.format(rand.choice(context.teacher_ids)))
+        client.get('teacher timetable', '/schedule/teacher/{}/week'.format(rand.choice(context.teacher_ids)))
+
+
+def scenario_admin_lists(client, context, rand):
+    if context.admins and client.login(rand.choice(context.admins), context.password):
+        for path in ADMIN_LISTS:
+            client.get('admin list', path)
+
+
+SCENARIOS = {
+    'login': scenario_login,
+    'timetable': scenario_timetable,
+    'dashboards': scenario_dashboards,
+    'admin_lists': scenario_admin_lists,
+}
+
+
+def run(base_url, scenarios, context, clients=10, duration=30.0, seed=None):
+    """
+    Run the scenarios round robin from concurrent clients for duration
+    seconds against a running server. Returns (Results, seconds)
+    """
+    results = Results()
+    deadline = time.time() + duration
+
+    def worker(number):
+        rand = random.Random(None if seed is None else seed + number)
+        turn = number
+        while time.time() < deadline:
+            client = Client(base_url, results)
+            SCENARIOS[scenarios[turn % len(scenarios)]](client, context, rand)
+            turn += 1
+
+    started = time.time()
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.time() - started
@@ -1,9 +1,11 @@
 import datetime
 from flask_login import UserMixin
-from sqlalchemy import UniqueConstraint, CheckConstraint
+from sqlalchemy import UniqueConstraint, CheckConstraint, Index, DDL, event
 from sqlalchemy.ext.hybrid import hybrid_property
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from app import db, login_manager
+from app.cache import reference_cache, user_cache
+from app.passwords import hash_password
 
 
 class User(UserMixin, db.Model):
@@ -45,7 +47,7 @@ class User(UserMixin, db.Model):
         """
         if len(password) <= 10:
             raise AttributeError('password must be longer than 10 characters')
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def verify_password(self, password):
         """
@@ -64,10 +66,64 @@ class User(UserMixin, db.Model):
         return '{}: {} {} {}'.format(self.id, self.last_name, self.first_name, self.middle_name)
 
 
+class UserSnapshot(UserMixin):
+    """
+    Lightweight detached copy of a user kept as current_user
+    """
+
+    def __init__(self, user):
+        self.id = user.id
+        self.role_id = user.role_id
+        self.is_admin = user.is_admin
+        self.first_name = user.first_name
+        self.last_name = user.last_name
+        self.middle_name = user.middle_name
+
+    @property
+    def fullname(self):
+        return self.last_name + " " + self.first_name + " " + self.middle_name
+
+    @property
+    def roles(self):
+        return reference_cache.get(Role, self.role_id)
+
+    def __repr__(self):
+        return '<UserSnapshot {}: {} {} {}>'.format(self.id, self.last_name, self.first_name, self.middle_name)
+
+
+def _load_user_snapshot(user_id):
+    user = User.query.get(user_id)
+    if user is None:
+        return None
+    return UserSnapshot(user)
+
+
+# prefix searches on lower(...) LIKE 'abc%' can use these indexes on PostgreSQL
+db.Index('ix_users_last_name_prefix', db.func.lower(User.last_name).label('last_name_lower'),
+         postgresql_ops={'last_name_lower': 'varchar_pattern_ops'})
+db.Index('ix_users_email_prefix', db.func.lower(User.email).label('email_lower'),
+         postgresql_ops={'email_lower': 'varchar_pattern_ops'})
+
+
+def search_users_by_prefix(term, role_id=None, limit=20):
+    """
+    Users whose last name or email starts with term
+    """
+    term = term.strip().lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    if not term:
+        return []
+
+    query = User.query.filter(db.or_(db.func.lower(User.last_name).like(term + '%', escape='\\'),
+                                     db.func.lower(User.email).like(term + '%', escape='\\')))
+    if role_id is not None:
+        query = query.filter(User.role_id == role_id)
+    return query.order_by(User.last_name, User.first_name).limit(limit).all()
+
+
 # Set up user_loader
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id), _load_user_snapshot)
 
 
 def get_name_user(user_id):
@@ -197,8 +253,22 @@ class TeacherToSubject(db.Model):
     def __repr__(self):
         return '<TeacherToSubject: teacher {} - subject {}>'.format(self.user_id_teacher, self.subject_id)
 
+    @property
+    def label(self):
+        """
+        Option label; free of queries once users and subjects are loaded, see with_labels()
+        """
+        return '{}: {} - {}'.format(self.id, self.users.fullname, self.subjects.name)
+
+    @classmethod
+    def with_labels(cls):
+        """
+        Teacher-subject links with teacher and subject joined in the same query
+        """
+        return cls.query.options(db.joinedload(cls.users), db.joinedload(cls.subjects)).order_by(cls.id)
+
     def __str__(self):
-        return '{}: {} - {}'.format(self.id, get_name_user(self.user_id_teacher), get_name_subject(self.subject_id))
+        return self.label
 
 
 class RoomSpecialization(db.Model):
@@ -282,6 +352,7 @@ class EducationPlan(db.Model):
     __tablename__ = 'education_plan'
     __table_args__ = (
         UniqueConstraint('day', 'year', 'lessonNumber', 'semester', name='_plans'),
+        Index('ix_education_plan_semester_slots', 'year', 'semester', 'day', 'lessonNumber'),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -357,6 +428,10 @@ class Schedule(db.Model):
     __tablename__ = 'schedules'
     __table_args__ = (
         UniqueConstraint('class_id', 'educationPlan_id', name='_schedulesUnique'),
+        # backs find_conflicts() against two admins booking the same slot at once
+        UniqueConstraint('educationPlan_id', 'classroom_id', name='_schedulesClassroomUnique'),
+        Index('ix_schedules_teacher_subject_plan', 'teacher_subject_id', 'educationPlan_id'),
+        Index('ix_schedules_plan_teacher_subject', 'educationPlan_id', 'teacher_subject_id'),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -371,12 +446,50 @@ class Schedule(db.Model):
         return '<Schedule: {}>'.format(self.id)
 
 
+class TimetableEntry(db.Model):
+    """
+    TimetableEntry table: one row per Schedule with everything timetables
+    show, kept in sync by app/schedule/entries.py
+    """
+
+    __tablename__ = 'timetable_entries'
+    __table_args__ = (
+        Index('ix_timetable_entries_class_slot', 'class_id', 'year', 'semester', 'day', 'lesson_number'),
+        Index('ix_timetable_entries_teacher_slot', 'teacher_id', 'year', 'semester', 'day', 'lesson_number'),
+        Index('ix_timetable_entries_semester', 'year', 'semester'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    schedule_id = db.Column(db.Integer, db.ForeignKey('schedules.id', ondelete='CASCADE'),
+                            nullable=False, unique=True)
+    plan_id = db.Column(db.Integer, nullable=False, index=True)
+    year = db.Column(db.Integer, nullable=False)
+    semester = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Integer, nullable=False)
+    lesson_number = db.Column(db.Integer, nullable=False)
+    class_id = db.Column(db.Integer, nullable=False)
+    class_name = db.Column(db.String(3))
+    teacher_subject_id = db.Column(db.Integer, nullable=False, index=True)
+    teacher_id = db.Column(db.Integer, nullable=False)
+    teacher_name = db.Column(db.String(92))
+    subject_id = db.Column(db.Integer, nullable=False, index=True)
+    subject_name = db.Column(db.String(50))
+    classroom_id = db.Column(db.Integer, nullable=False, index=True)
+    classroom_name = db.Column(db.String(5))
+
+    def __repr__(self):
+        return '<TimetableEntry: {}>'.format(self.schedule_id)
+
+
 class Grade(db.Model):
     """
     Grades table
     """
 
     __tablename__ = 'grades'
+    __table_args__ = (
+        Index('ix_grades_schedule_student', 'schedule_id', 'student_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     grade = db.Column(db.Integer, nullable=False)
@@ -385,4 +498,112 @@ class Grade(db.Model):
     student_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
     def __repr__(self):
-        return '<Grade: student:{} grade:{}>'.format(self.student_id, self.grade)
\ No newline at end of file
+        return '<Grade: student:{} grade:{}>'.format(self.student_id, self.grade)
+
+
+class GradeRollup(db.Model):
+    """
+    GradeRollup table: running grade totals per student, class or teacher,
+    subject and semester, kept up to date on every grade write
+    """
+
+    __tablename__ = 'grade_rollups'
+    __table_args__ = (
+        UniqueConstraint('scope', 'scope_id', 'subject_id', 'year', 'semester', name='_gradeRollupUnique'),
+        Index('ix_grade_rollups_period', 'year', 'semester', 'scope'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(10), nullable=False)
+    scope_id = db.Column(db.Integer, nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    semester = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.BigInteger, nullable=False, default=0)
+    total_squares = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @hybrid_property
+    def average(self):
+        return float(self.total) / self.count if self.count else None
+
+    @property
+    def deviation(self):
+        if not self.count:
+            return None
+        mean = float(self.total) / self.count
+        return max(float(self.total_squares) / self.count - mean * mean, 0.0) ** 0.5
+
+    def __repr__(self):
+        return '<GradeRollup: {} {} subject {}: {}/{}>'.format(self.scope, self.scope_id, self.subject_id,
+                                                              self.total, self.count)
+
+
+class ScheduleVersion(db.Model):
+    """
+    ScheduleVersion table: one counter bumped on every timetable change,
+    used for feed ETags
+    """
+
+    __tablename__ = 'schedule_versions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<ScheduleVersion: {}>'.format(self.version)
+
+
+class PublishedSchedule(db.Model):
+    """
+    PublishedSchedule table: an immutable snapshot of a year/semester
+    schedule, its lessons packed as compressed JSON (app/schedule/publishing.py)
+    """
+
+    __tablename__ = 'published_schedules'
+    __table_args__ = (
+        UniqueConstraint('year', 'semester', 'number', name='_publishedScheduleUnique'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    semester = db.Column(db.Integer, nullable=False)
+    number = db.Column(db.Integer, nullable=False)
+    published_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    lessons_count = db.Column(db.Integer, nullable=False, default=0)
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False))
+
+    def __repr__(self):
+        return '<PublishedSchedule: {}/{} #{}>'.format(self.year, self.semester, self.number)
+
+
+@event.listens_for(PublishedSchedule, 'before_update')
+def _published_schedule_is_immutable(mapper, connection, target):
+    raise ValueError('published schedules are immutable, publish a new version instead')
+
+
+def search_document(*columns):
+    """
+    lower(a || ' ' || b ...), the text global search matches against.
+    Only immutable functions, so PostgreSQL can index it
+    """
+    document = None
+    for column in columns:
+        document = column if document is None else document + ' ' + column
+    return db.func.lower(document)
+
+
+USER_SEARCH_DOCUMENT = search_document(User.first_name, User.last_name, User.middle_name, User.email,
+                                       db.func.coalesce(User.telephone, ''))
+
+# substring search (app/search.py) on PostgreSQL goes through trigram GIN indexes
+event.listen(db.metadata, 'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+db.Index('ix_users_search_trgm', USER_SEARCH_DOCUMENT.label('users_document'),
+         postgresql_using='gin', postgresql_ops={'users_document': 'gin_trgm_ops'})
+db.Index('ix_classes_name_trgm', db.func.lower(Class.name).label('classes_name'),
+         postgresql_using='gin', postgresql_ops={'classes_name': 'gin_trgm_ops'})
+db.Index('ix_subjects_name_trgm', db.func.lower(Subject.name).label('subjects_name'),
+         postgresql_using='gin', postgresql_ops={'subjects_name': 'gin_trgm_ops'})
+db.Index('ix_classrooms_name_trgm', db.func.lower(Classroom.name).label('classrooms_name'),
+         postgresql_using='gin', postgresql_ops={'classrooms_name': 'gin_trgm_ops'})
@@ -0,0 +1,115 @@
+import base64
+import json
+
+from flask import abort, request
+from sqlalchemy import and_, or_
+
+from . import db
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError):
+        abort(400)
+
+
+def _seek(columns, values, forward):
+    """
+    Rows strictly after (or before) the key, for an ascending order on columns:
+    (a > x) OR (a = x AND b > y) OR ...
+    """
+    if len(values) != len(columns):
+        abort(400)
+
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        clauses.append(and_(*(equal + [column > values[i] if forward else column < values[i]])))
+    return or_(*clauses)
+
+
+def estimate_count(query):
+    """
+    Planner row estimate of a query on PostgreSQL, None elsewhere
+    """
+    bind = db.session.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return None
+
+    statement = query.statement.compile(dialect=bind.dialect, compile_kwargs={'literal_binds': True})
+    plan = db.session.execute('EXPLAIN (FORMAT JSON) {}'.format(statement)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPage(object):
+    """
+    One page of a keyset (seek) pagination
+    """
+
+    def __init__(self, items, page, per_page, next_cursor, prev_cursor, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, columns, page=1, per_page=10, estimate=False):
+    """
+    Paginate a query by seeking past the last seen key instead of OFFSET.
+
+    columns is the ascending sort order and must end with a unique column
+    (usually the primary key). The cursor comes from the ``after`` or
+    ``before`` request argument, so a deep page costs the same as page 1
+    and no COUNT(*) is run. With estimate=True the page also carries the
+    planner's approximate total.
+    """
+    after = request.args.get('after')
+    before = request.args.get('before')
+    forward = before is None
+
+    total = estimate_count(query) if estimate else None
+
+    query = query.add_columns(*columns).order_by(None)
+    if forward:
+        if after is not None:
+            query = query.filter(_seek(columns, decode_cursor(after), True))
+        query = query.order_by(*columns)
+    else:
+        query = query.filter(_seek(columns, decode_cursor(before), False))
+        query = query.order_by(*[column.desc() for column in columns])
+
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    first_key = encode_cursor(rows[0][1:]) if rows else None
+    last_key = encode_cursor(rows[-1][1:]) if rows else None
+
+    if forward:
+        next_cursor = last_key if more else None
+        prev_cursor = first_key if after is not None else None
+    else:
+        next_cursor = last_key
+        prev_cursor = first_key if more else None
+
+    return KeysetPage(items, page, per_page, next_cursor, prev_cursor, total)
@@ -0,0 +1,39 @@
+from functools import partial
+
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash
+
+# full method prefix of the hashes each configured method produces,
+# e.g. 'pbkdf2:sha256' -> 'pbkdf2:sha256:600000'
+_prefixes = {}
+
+
+def hash_method():
+    """
+    PASSWORD_HASH_METHOD, e.g. 'pbkdf2:sha256:600000', or None for werkzeug's default
+    """
+    return current_app.config.get('PASSWORD_HASH_METHOD') if has_app_context() else None
+
+
+def hash_function():
+    """
+    Picklable function hashing a password with the configured method,
+    for worker processes
+    """
+    method = hash_method()
+    return partial(generate_password_hash, method=method) if method else generate_password_hash
+
+
+def hash_password(password):
+    return hash_function()(password)
+
+
+def needs_rehash(password_hash):
+    """
+    Whether a stored hash was made with other parameters than the current ones
+    """
+    method = hash_method()
+    prefix = _prefixes.get(method)
+    if prefix is None:
+        prefix = _prefixes[method] = hash_password('').split('$', 1)[0]
+    return password_hash.split('$', 1)[0] != prefix
@@ -0,0 +1,52 @@
+from sqlalchemy import tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from . import db, page_cache
+from .models import EducationPlan
+from .schedule.versions import bump_version
+
+DEFAULT_DAYS = range(1, 7)
+DEFAULT_LESSONS = range(1, 8)
+
+
+def plan_grid(years, semesters, days=DEFAULT_DAYS, lessons=DEFAULT_LESSONS):
+    """
+    Every (day, year, lessonNumber, semester) slot of the requested grid
+    """
+    return [{'day': day, 'year': year, 'lessonNumber': lesson, 'semester': semester}
+            for year in years
+            for semester in semesters
+            for day in days
+            for lesson in lessons]
+
+
+def generate_plans(years, semesters, days=DEFAULT_DAYS, lessons=DEFAULT_LESSONS):
+    """
+    Create the education plan grid in one multi-row insert and one commit.
+    Slots that already exist are skipped through the _plans unique constraint.
+    Returns the number of created plans
+    """
+    rows = plan_grid(years, semesters, days, lessons)
+    if not rows:
+        return 0
+
+    table = EducationPlan.__table__
+    if db.session.get_bind().dialect.name == 'postgresql':
+        statement = pg_insert(table).values(rows).on_conflict_do_nothing(constraint='_plans')
+        created = db.session.execute(statement).rowcount
+    else:
+        existing = set(db.session.query(EducationPlan.day, EducationPlan.year,
+                                        EducationPlan.lessonNumber, EducationPlan.semester)
+                       .filter(tuple_(EducationPlan.year, EducationPlan.semester)
+                               .in_(set((row['year'], row['semester']) for row in rows))))
+        rows = [row for row in rows
+                if (row['day'], row['year'], row['lessonNumber'], row['semester']) not in existing]
+        if rows:
+            db.session.execute(table.insert(), rows)
+        created = len(rows)
+
+    if created:
+        bump_version()
+    db.session.commit()
+    page_cache.invalidate('schedule')
+    return created
@@ -2,4 +2,6 @@ from flask import Blueprint
 
 schedule = Blueprint('schedule', __name__)
 
+# entries keeps timetable_entries in sync through session events
+from . import entries
 from . import views
@@ -0,0 +1,123 @@
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import Schedule, EducationPlan, TeacherToSubject, User, Subject, Classroom, Class, TimetableEntry
+
+# timetable_entries column holding the key of each source model, and
+# the source column that finds the schedules built from that key
+KEYS = (
+    (Schedule, TimetableEntry.schedule_id, Schedule.id),
+    (EducationPlan, TimetableEntry.plan_id, Schedule.educationPlan_id),
+    (TeacherToSubject, TimetableEntry.teacher_subject_id, Schedule.teacher_subject_id),
+    (User, TimetableEntry.teacher_id, TeacherToSubject.user_id_teacher),
+    (Subject, TimetableEntry.subject_id, TeacherToSubject.subject_id),
+    (Classroom, TimetableEntry.classroom_id, Schedule.classroom_id),
+    (Class, TimetableEntry.class_id, Schedule.class_id),
+)
+
+# only changes to these attributes show up in a timetable entry
+COPIED = {
+    EducationPlan: ('year', 'semester', 'day', 'lessonNumber'),
+    TeacherToSubject: ('user_id_teacher', 'subject_id'),
+    User: ('last_name', 'first_name', 'middle_name'),
+    Subject: ('name',),
+    Classroom: ('name',),
+    Class: ('name',),
+}
+
+ENTRY_COLUMNS = ['schedule_id', 'plan_id', 'year', 'semester', 'day', 'lesson_number',
+                 'class_id', 'class_name', 'teacher_subject_id', 'teacher_id', 'teacher_name',
+                 'subject_id', 'subject_name', 'classroom_id', 'classroom_name']
+
+
+def source(*criteria):
+    """
+    SELECT producing timetable_entries rows from the normalized tables
+    """
+    query = db.select([Schedule.id,
+                       EducationPlan.id,
+                       EducationPlan.year,
+                       EducationPlan.semester,
+                       EducationPlan.day,
+                       EducationPlan.lessonNumber,
+                       Class.id,
+                       Class.name,
+                       TeacherToSubject.id,
+                       User.id,
+                       User.last_name + ' ' + User.first_name + ' ' + User.middle_name,
+                       Subject.id,
+                       Subject.name,
+                       Classroom.id,
+                       Classroom.name]) \
+        .select_from(Schedule.__table__
+                     .join(EducationPlan.__table__, EducationPlan.id == Schedule.educationPlan_id)
+                     .join(TeacherToSubject.__table__, TeacherToSubject.id == Schedule.teacher_subject_id)
+                     .join(User.__table__, User.id == TeacherToSubject.user_id_teacher)
+                     .join(Subject.__table__, Subject.id == TeacherToSubject.subject_id)
+                     .join(Class.__table__, Class.id == Schedule.class_id)
+                     .join(Classroom.__table__, Classroom.id == Schedule.classroom_id))
+    for criterion in criteria:
+        query = query.where(criterion)
+    return query
+
+
+def refresh(session, entry_column, source_column, ids):
+    """
+    Replace the entries built from the given keys: the ones still holding
+    a key and the ones whose schedule now refers to it
+    """
+    table = TimetableEntry.__table__
+    ids = list(ids)
+    current = db.select([Schedule.id]) \
+        .select_from(Schedule.__table__
+                     .join(TeacherToSubject.__table__, TeacherToSubject.id == Schedule.teacher_subject_id)) \
+        .where(source_column.in_(ids))
+    session.execute(table.delete().where(or_(entry_column.in_(ids), table.c.schedule_id.in_(current))))
+    session.execute(table.insert().from_select(ENTRY_COLUMNS, source(source_column.in_(ids))))
+
+
+def rebuild(year=None, semester=None, session=None):
+    """
+    Rebuild the entries of one year/semester, or all of them, from the
+    normalized tables. Bulk Core writes to schedules must call this
+    themselves. Returns the number of entries
+    """
+    session = session or db.session
+    table = TimetableEntry.__table__
+    criteria = []
+    if year is not None:
+        criteria.append(EducationPlan.year == year)
+    if semester is not None:
+        criteria.append(EducationPlan.semester == semester)
+
+    delete = table.delete()
+    if criteria:
+        plans = db.select([EducationPlan.id])
+        for criterion in criteria:
+            plans = plans.where(criterion)
+        delete = delete.where(table.c.plan_id.in_(plans))
+    session.execute(delete)
+    return session.execute(table.insert().from_select(ENTRY_COLUMNS, source(*criteria))).rowcount
+
+
+def _changed(session, instance):
+    if instance in session.new:
+        return isinstance(instance, Schedule)
+    if instance in session.deleted or isinstance(instance, Schedule):
+        return True
+    state = inspect(instance)
+    return any(state.attrs[name].history.has_changes() for name in COPIED[type(instance)])
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_entries(session, flush_context):
+    # attribute history still holds what this flush wrote
+    changed = {}
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, tuple(COPIED) + (Schedule,)) and _changed(session, instance):
+            changed.setdefault(type(instance), set()).add(instance.id)
+
+    for model, entry_column, source_column in KEYS:
+        if changed.get(model):
+            refresh(session, entry_column, source_column, changed[model])
@@ -0,0 +1,116 @@
+import datetime
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeSerializer
+
+from .timetable import DAYS
+
+# first and last day of the semesters: (month, day)
+SEMESTER_DATES = {
+    1: ((9, 1), (12, 31)),
+    2: ((1, 1), (5, 31)),
+}
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='schedule-feed')
+
+
+def feed_token(kind, id):
+    """
+    Token that lets a calendar client read one feed without logging in
+    """
+    return _serializer().dumps([kind, id])
+
+
+def check_feed_token(token, kind, id):
+    try:
+        return _serializer().loads(token) == [kind, id]
+    except BadSignature:
+        return False
+
+
+def feed_etag(kind, id, year, semester, version, fmt):
+    return '{}-{}-{}-{}-v{}-{}'.format(kind, id, year, semester, version, fmt)
+
+
+def lesson_times(number):
+    """
+    Start and end of a lesson from LESSON_TIMES / LESSON_DURATION, None
+    when LESSON_TIMES has no start for the lesson number
+    """
+    starts = current_app.config['LESSON_TIMES']
+    if not 1 <= number <= len(starts):
+        return None
+    start = starts[number - 1]
+    hours, minutes = (int(part) for part in start.split(':'))
+    start = datetime.time(hours, minutes)
+    end = (datetime.datetime.combine(datetime.date.today(), start) +
+           datetime.timedelta(minutes=current_app.config['LESSON_DURATION'])).time()
+    return start, end
+
+
+def semester_range(year, semester):
+    (start_month, start_day), (end_month, end_day) = SEMESTER_DATES[semester]
+    return datetime.date(year, start_month, start_day), datetime.date(year, end_month, end_day)
+
+
+def first_day(start, day):
+    """
+    First date on or after start falling on day (1 is Monday)
+    """
+    return start + datetime.timedelta(days=(day - 1 - start.weekday()) % 7)
+
+
+def lesson_events(week, title, description):
+    """
+    (lesson, title, description) for every scheduled lesson of a week grid
+    """
+    for day, lessons in week.items():
+        for lesson in lessons:
+            if lesson.schedule_id:
+                yield lesson, title(lesson), description(lesson)
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def to_ical(name, week, year, semester, title, description):
+    """
+    iCalendar text with one weekly recurring event per lesson
+    """
+    start, end = semester_range(year, semester)
+    stamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    host = current_app.config.get('SERVER_NAME') or 'schooldb'
+
+    lines = ['BEGIN:VCALENDAR',
+             'VERSION:2.0',
+             'PRODID:-//SchoolDB//Schedule//EN',
+             'X-WR-CALNAME:{}'.format(_escape(name))]
+    for lesson, summary, details in lesson_events(week, title, description):
+        times = lesson_times(lesson.number)
+        if times is None:
+            # a calendar event at a made-up time is worse than none
+            continue
+        begins, ends = times
+        date = first_day(start, lesson.day)
+        lines += ['BEGIN:VEVENT',
+                  'UID:schedule-{}-{}@{}'.format(lesson.schedule_id, lesson.plan_id, host),
+                  'DTSTAMP:{}'.format(stamp),
+                  'DTSTART:{}'.format(datetime.datetime.combine(date, begins).strftime('%Y%m%dT%H%M%S')),
+                  'DTEND:{}'.format(datetime.datetime.combine(date, ends).strftime('%Y%m%dT%H%M%S')),
+                  'RRULE:FREQ=WEEKLY;UNTIL={}T235959'.format(end.strftime('%Y%m%d')),
+                  'SUMMARY:{}'.format(_escape(summary)),
+                  'DESCRIPTION:{}'.format(_escape(details)),
+                  'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(lines) + '\r\n'
+
+
+def to_json(week):
+    """
+    Plain week grid: [{day, name, lessons}]
+    """
+    return [{'day': day, 'name': DAYS[day], 'lessons': [dict(lesson._asdict()) for lesson in lessons]}
+            for day, lessons in week.items()]
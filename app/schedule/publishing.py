@@ -0,0 +1,216 @@
+import json
+import threading
+import zlib
+from collections import OrderedDict, defaultdict, namedtuple
+
+from .. import db
+from ..models import PublishedSchedule, TimetableEntry
+
+# one lesson of a published version; the whole tuple is its identity,
+# so two versions are compared with plain set operations
+PublishedLesson = namedtuple('PublishedLesson', ['class_id', 'day', 'number', 'subject_id',
+                                                 'teacher_id', 'classroom_id'])
+
+Version = namedtuple('Version', ['id', 'number', 'lessons', 'names'])
+
+Diff = namedtuple('Diff', ['added', 'removed', 'moved'])
+
+NAME_KINDS = ('classes', 'subjects', 'teachers', 'classrooms')
+
+
+def move_key(lesson):
+    """
+    Lessons of the same class, subject and teacher count as moved when
+    one leaves a slot or room and another one appears
+    """
+    return lesson.class_id, lesson.subject_id, lesson.teacher_id
+
+
+def snapshot(year, semester):
+    """
+    Lessons of a year/semester and the names they refer to, read from timetable_entries
+    """
+    rows = db.session.query(TimetableEntry.class_id,
+                            TimetableEntry.day,
+                            TimetableEntry.lesson_number,
+                            TimetableEntry.subject_id,
+                            TimetableEntry.teacher_id,
+                            TimetableEntry.classroom_id,
+                            TimetableEntry.class_name,
+                            TimetableEntry.subject_name,
+                            TimetableEntry.teacher_name,
+                            TimetableEntry.classroom_name) \
+        .filter(TimetableEntry.year == year, TimetableEntry.semester == semester)
+
+    lessons = set()
+    names = dict((kind, {}) for kind in NAME_KINDS)
+    for row in rows:
+        lesson = PublishedLesson(*row[:6])
+        lessons.add(lesson)
+        names['classes'][lesson.class_id] = row[6]
+        names['subjects'][lesson.subject_id] = row[7]
+        names['teachers'][lesson.teacher_id] = row[8]
+        names['classrooms'][lesson.classroom_id] = row[9]
+    return frozenset(lessons), names
+
+
+def pack(lessons, names):
+    """
+    Compressed JSON of a snapshot: lessons as sorted id arrays, names once per id
+    """
+    document = {'lessons': sorted(lessons),
+                'names': dict((kind, dict((str(id), name) for id, name in names[kind].items()))
+                              for kind in NAME_KINDS)}
+    return zlib.compress(json.dumps(document, separators=(',', ':'), sort_keys=True).encode('utf-8'), 9)
+
+
+def unpack(data):
+    document = json.loads(zlib.decompress(data).decode('utf-8'))
+    lessons = frozenset(PublishedLesson(*lesson) for lesson in document['lessons'])
+    names = dict((kind, dict((int(id), name) for id, name in document['names'][kind].items()))
+                 for kind in NAME_KINDS)
+    return lessons, names
+
+
+def latest_version(year, semester):
+    return PublishedSchedule.query.filter_by(year=year, semester=semester) \
+        .order_by(PublishedSchedule.number.desc()).first()
+
+
+def publish(year, semester):
+    """
+    Store the current schedule of a year/semester as its next version.
+    Returns the new PublishedSchedule, or None when nothing changed
+    since the latest one. The caller commits
+    """
+    lessons, names = snapshot(year, semester)
+    latest = latest_version(year, semester)
+    if latest is not None:
+        previous = load(latest)
+        if previous.lessons == lessons and previous.names == names:
+            return None
+
+    version = PublishedSchedule(year=year,
+                                semester=semester,
+                                number=latest.number + 1 if latest else 1,
+                                lessons_count=len(lessons),
+                                data=pack(lessons, names))
+    db.session.add(version)
+    return version
+
+
+class VersionCache(object):
+    """
+    Unpacked versions and diffs between them. Published versions never
+    change, so entries stay valid until they are pushed out
+    """
+
+    def __init__(self, max_entries=64):
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def reserve(self, count):
+        """
+        Grow to hold at least count entries, so a page walking every
+        version does not push its own entries out
+        """
+        with self._lock:
+            self.max_entries = max(self.max_entries, count)
+
+    def get(self, key, build):
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        value = build()
+        with self._lock:
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+
+version_cache = VersionCache()
+
+
+def load(version):
+    """
+    Version of a PublishedSchedule; the blob is read and unpacked once
+    """
+    def build():
+        return Version(version.id, version.number, *unpack(version.data))
+    return version_cache.get(('version', version.id), build)
+
+
+EMPTY = Version(None, 0, frozenset(), dict((kind, {}) for kind in NAME_KINDS))
+
+
+def diff(old, new):
+    """
+    Lessons added, removed and moved from one lesson set to another.
+    Unchanged lessons fall out of the two set differences; what is left
+    is paired up by class, subject and teacher into moves
+    """
+    added = defaultdict(list)
+    removed = defaultdict(list)
+    for lesson in new - old:
+        added[move_key(lesson)].append(lesson)
+    for lesson in old - new:
+        removed[move_key(lesson)].append(lesson)
+
+    moved = []
+    for key in set(added) & set(removed):
+        # pair the earliest remaining slots with each other
+        gone, came = sorted(removed[key]), sorted(added[key])
+        count = min(len(gone), len(came))
+        moved.extend(zip(gone[:count], came[:count]))
+        removed[key], added[key] = gone[count:], came[count:]
+
+    return Diff(added=sorted(lesson for lessons in added.values() for lesson in lessons),
+                removed=sorted(lesson for lessons in removed.values() for lesson in lessons),
+                moved=sorted(moved))
+
+
+def diff_versions(old, new):
+    """
+    Diff between two Versions, cached by their ids
+    """
+    if old.id is None:
+        return diff(old.lessons, new.lessons)
+    return version_cache.get(('diff', old.id, new.id), lambda: diff(old.lessons, new.lessons))
+
+
+def filter_diff(changes, class_id=None, teacher_id=None):
+    """
+    Part of a diff touching one class or one teacher
+    """
+    def wanted(lesson):
+        return (class_id is None or lesson.class_id == class_id) and \
+               (teacher_id is None or lesson.teacher_id == teacher_id)
+    return Diff(added=[lesson for lesson in changes.added if wanted(lesson)],
+                removed=[lesson for lesson in changes.removed if wanted(lesson)],
+                moved=[(old, new) for old, new in changes.moved if wanted(old) or wanted(new)])
+
+
+def lesson_json(lesson, names):
+    return {'class_id': lesson.class_id,
+            'class': names['classes'].get(lesson.class_id),
+            'day': lesson.day,
+            'lesson': lesson.number,
+            'subject_id': lesson.subject_id,
+            'subject': names['subjects'].get(lesson.subject_id),
+            'teacher_id': lesson.teacher_id,
+            'teacher': names['teachers'].get(lesson.teacher_id),
+            'classroom_id': lesson.classroom_id,
+            'classroom': names['classrooms'].get(lesson.classroom_id)}
+
+
+def diff_json(changes, old, new):
+    """
+    Diff as JSON-ready lists; removed lessons are named as they were in the old version
+    """
+    return {'added': [lesson_json(lesson, new.names) for lesson in changes.added],
+            'removed': [lesson_json(lesson, old.names) for lesson in changes.removed],
+            'moved': [{'from': lesson_json(before, old.names), 'to': lesson_json(after, new.names)}
+                      for before, after in changes.moved]}
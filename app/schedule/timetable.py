@@ -0,0 +1,75 @@
+from collections import OrderedDict, namedtuple
+
+from .. import db
+from ..models import EducationPlan, TimetableEntry
+
+DAYS = {
+    1: 'Monday',
+    2: 'Tuesday',
+    3: 'Wednesday',
+    4: 'Thursday',
+    5: 'Friday',
+    6: 'Saturday',
+    7: 'Sunday'
+}
+
+Lesson = namedtuple('Lesson', ['plan_id', 'day', 'number', 'schedule_id',
+                               'teacher_id', 'teacher_name', 'subject_name', 'classroom_name'])
+
+TeacherLesson = namedtuple('TeacherLesson', ['plan_id', 'day', 'number', 'schedule_id',
+                                             'class_id', 'class_name', 'subject_name', 'classroom_name'])
+
+
+def build_week(rows):
+    """
+    Group flat (day, lesson) rows into an ordered day x lesson grid
+    """
+    week = OrderedDict()
+    for row in rows:
+        week.setdefault(row.day, []).append(row)
+    return week
+
+
+def semester_slots(year, semester):
+    """
+    (plan id, day, lesson) of every slot of a semester, in order
+    """
+    return db.session.query(EducationPlan.id, EducationPlan.day, EducationPlan.lessonNumber) \
+        .filter(EducationPlan.year == year, EducationPlan.semester == semester) \
+        .order_by(EducationPlan.day, EducationPlan.lessonNumber).all()
+
+
+def _by_plan(entries):
+    lessons = {}
+    for entry in entries:
+        lessons.setdefault(entry.plan_id, []).append(entry)
+    return lessons
+
+
+def class_week(class_id, year, semester):
+    """
+    Whole week of a class: every plan slot of the semester with the class
+    lesson in it, read from timetable_entries through its class index
+    """
+    lessons = _by_plan(TimetableEntry.query.filter_by(class_id=class_id, year=year, semester=semester))
+
+    return build_week(Lesson(plan_id, day, number, entry.schedule_id, entry.teacher_id,
+                             entry.teacher_name, entry.subject_name, entry.classroom_name)
+                      if entry else Lesson(plan_id, day, number, None, None, None, None, None)
+                      for plan_id, day, number in semester_slots(year, semester)
+                      for entry in lessons.get(plan_id, [None]))
+
+
+def teacher_week(teacher_id, year, semester):
+    """
+    Whole week of a teacher across all of his subjects, read from
+    timetable_entries through its teacher index
+    """
+    lessons = _by_plan(TimetableEntry.query.filter_by(teacher_id=teacher_id, year=year, semester=semester)
+                       .order_by(TimetableEntry.class_name))
+
+    return build_week(TeacherLesson(plan_id, day, number, entry.schedule_id, entry.class_id,
+                                    entry.class_name, entry.subject_name, entry.classroom_name)
+                      if entry else TeacherLesson(plan_id, day, number, None, None, None, None, None)
+                      for plan_id, day, number in semester_slots(year, semester)
+                      for entry in lessons.get(plan_id, [None]))
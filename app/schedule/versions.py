@@ -0,0 +1,55 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .. import db
+from ..models import Schedule, EducationPlan, TeacherToSubject, Subject, Classroom, Class, User, ScheduleVersion
+from .entries import COPIED
+
+# rows of these models end up in timetables and feeds
+TRACKED = (Schedule, EducationPlan, TeacherToSubject, Subject, Classroom, Class, User)
+
+VERSION_ID = 1
+
+
+def current_version():
+    """
+    Current timetable version, one primary key lookup
+    """
+    return db.session.query(ScheduleVersion.version).filter(ScheduleVersion.id == VERSION_ID).scalar() or 0
+
+
+def bump_version(session=None):
+    """
+    Move the timetable version forward inside the current transaction.
+    Bulk Core writes to tracked tables must call this themselves
+    """
+    session = session or db.session
+    table = ScheduleVersion.__table__
+    updated = session.execute(table.update()
+                              .where(table.c.id == VERSION_ID)
+                              .values(version=table.c.version + 1)).rowcount
+    if not updated:
+        session.execute(table.insert().values(id=VERSION_ID, version=1))
+
+
+def _shows_in_timetable(session, instance):
+    """
+    Whether a pending change reaches a timetable or feed: new lessons and
+    slots, deletions, and edits of the columns they display
+    """
+    if instance in session.new:
+        return isinstance(instance, (Schedule, EducationPlan))
+    if instance in session.deleted:
+        return True
+    if isinstance(instance, Schedule):
+        return session.is_modified(instance)
+    state = inspect(instance)
+    return any(state.attrs[name].history.has_changes() for name in COPIED[type(instance)])
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_on_timetable_change(session, flush_context, instances):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, TRACKED) and _shows_in_timetable(session, instance):
+            bump_version(session)
+            return
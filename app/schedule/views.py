@@ -4,10 +4,17 @@ from sqlalchemy.orm.exc import NoResultFound
 
 from . import schedule
 
-from flask import render_template, abort
+from flask import abort, request, jsonify, make_response
 from flask_login import login_required, current_user
 
-from ..models import Schedule, EducationPlan, Class, TeacherToSubject
+from .. import page_cache
+from ..database import replica_reads
+from ..models import Schedule, EducationPlan, Class, TeacherToSubject, User, PublishedSchedule
+from .feeds import check_feed_token, feed_etag, feed_token, to_ical, to_json
+from .publishing import EMPTY, diff_json, diff_versions, filter_diff, load
+from .timetable import DAYS, class_week, teacher_week
+from .versions import current_version
+from ..fragment_cache import render_block
 
 
 def user_access():
@@ -29,58 +36,191 @@ def curr_semester():
 
 @schedule.route('/schedule/class/<int:id_class>/day/<int:id_day>')
 @login_required
+@replica_reads
 def list_schedule_class(id_class, id_day):
     """
     Show schedule for some class
     """
 
-    schedules = []
+    def render():
+        current_class = Class.query.get_or_404(id_class)
 
-    current_class = Class.query.get_or_404(id_class)
+        week = class_week(id_class, curr_year(), curr_semester())
+
+        return render_block('schedule/dayClassList.html',
+                            currentClass=current_class,
+                            schedules=week.get(id_day, []),
+                            currentDay=id_day,
+                            days=week.keys(),
+                            dayNames=DAYS)
+
+    return page_cache.render_page(('schedule', 'classes'), render, title='Schedule')
+
+
+@schedule.route('/schedule/teacher/<int:id_teacher>/week')
+@login_required
+@replica_reads
+def list_schedule_teacher_week(id_teacher):
+    """
+    Show week schedule for a teacher across all of his subjects
+    """
+    user_access()
+
+    def render():
+        teacher = User.query.get_or_404(id_teacher)
 
-    plans = EducationPlan.query.filter_by(year=curr_year(), semester=curr_semester(), day=id_day).order_by(
-        EducationPlan.year, EducationPlan.semester, EducationPlan.day, EducationPlan.lessonNumber).all()
-    for plan in plans:
-        try:
-            schedule_element = Schedule.query.filter_by(educationPlan_id=plan.id, class_id=id_class).one()
-            schedules.append(schedule_element)
-        except NoResultFound:
-            schedules.append(plan)
+        week = teacher_week(id_teacher, curr_year(), curr_semester())
 
-    plans_day = EducationPlan.query.filter_by(year=curr_year(), semester=curr_semester()).distinct(EducationPlan.day)
+        return render_block('schedule/weekTeacherList.html',
+                            teacher=teacher,
+                            week=week,
+                            dayNames=DAYS,
+                            feedToken=feed_token('teacher', id_teacher))
 
-    return render_template('schedule/dayClassList.html',
-                           currentClass=current_class,
-                           schedules=schedules,
-                           currentDay=plans[0],
-                           days=plans_day,
-                           title='Schedule')
+    return page_cache.render_page(('schedule', 'teachers'), render, title='Schedule')
 
 
 @schedule.route('/schedule/teacher/<int:id_subject>/day/<int:id_day>')
 @login_required
+@replica_reads
 def list_schedule_teacher(id_subject, id_day):
     """
     Show schedule
     """
     user_access()
 
-    schedules = []
-    teacher_subject = TeacherToSubject.query.get_or_404(id_subject)
-
-    all_plans = EducationPlan.query.filter_by(year=curr_year(),semester=curr_semester(),day=id_day).order_by(EducationPlan.year, EducationPlan.semester, EducationPlan.day, EducationPlan.lessonNumber).all()
-    for one_plan in all_plans:
-        try:
-            schedule = Schedule.query.filter_by(educationPlan_id=one_plan.id,teacher_subject_id=id_subject).one()
-            schedules.append(schedule)
-        except NoResultFound:
-            schedules.append(one_plan)
-
-    plans = EducationPlan.query.filter_by(year=curr_year(),semester=curr_semester()).distinct(EducationPlan.day)
-
-    return render_template('schedule/dayTeacherList.html',
-                           teacherSubject=teacher_subject,
-                           schedules=schedules,
-                           day=all_plans[0],
-                           plans=plans,
-                           title='Schedule')
\ No newline at end of file
+    def render():
+        schedules = []
+        teacher_subject = TeacherToSubject.query.get_or_404(id_subject)
+
+        all_plans = EducationPlan.query.filter_by(year=curr_year(),semester=curr_semester(),day=id_day).order_by(EducationPlan.year, EducationPlan.semester, EducationPlan.day, EducationPlan.lessonNumber).all()
+        for one_plan in all_plans:
+            try:
+                schedule = Schedule.query.filter_by(educationPlan_id=one_plan.id,teacher_subject_id=id_subject).one()
+                schedules.append(schedule)
+            except NoResultFound:
+                schedules.append(one_plan)
+
+        plans = EducationPlan.query.filter_by(year=curr_year(),semester=curr_semester()).distinct(EducationPlan.day)
+
+        return render_block('schedule/dayTeacherList.html',
+                            teacherSubject=teacher_subject,
+                            schedules=schedules,
+                            day=all_plans[0],
+                            plans=plans)
+
+    return page_cache.render_page(('schedule', 'teachers'), render, title='Schedule')
+
+
+def feed_access(kind, id):
+    """
+    Logged in users read what the HTML pages show them, anonymous
+    calendar clients need the feed token
+    """
+    if current_user.is_authenticated:
+        if kind == 'teacher':
+            user_access()
+    elif not check_feed_token(request.args.get('token', ''), kind, id):
+        abort(403)
+
+
+def feed_response(kind, id, fmt, name, build, title, description):
+    """
+    Feed of the current semester with a strong ETag from the timetable
+    version; clients holding the current version get a 304 before the
+    week is even loaded
+    """
+    feed_access(kind, id)
+
+    year, semester = curr_year(), curr_semester()
+    etag = feed_etag(kind, id, year, semester, current_version(), fmt)
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
+    week = build(id, year, semester)
+    if fmt == 'ics':
+        response = make_response(to_ical(name, week, year, semester, title, description))
+        response.mimetype = 'text/calendar'
+    else:
+        response = jsonify(year=year, semester=semester, days=to_json(week))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@schedule.route('/schedule/class/<int:id_class>/feed.<any(ics, json):fmt>')
+@replica_reads
+def class_feed(id_class, fmt):
+    """
+    Class timetable as iCalendar or JSON
+    """
+    current_class = Class.query.get_or_404(id_class)
+    return feed_response('class', id_class, fmt, 'Schedule {}'.format(current_class.name), class_week,
+                         lambda lesson: lesson.subject_name,
+                         lambda lesson: '{}, classroom {}'.format(lesson.teacher_name, lesson.classroom_name))
+
+
+@schedule.route('/schedule/teacher/<int:id_teacher>/feed.<any(ics, json):fmt>')
+@replica_reads
+def teacher_feed(id_teacher, fmt):
+    """
+    Teacher timetable as iCalendar or JSON
+    """
+    teacher = User.query.get_or_404(id_teacher)
+    return feed_response('teacher', id_teacher, fmt, 'Schedule {}'.format(teacher.fullname), teacher_week,
+                         lambda lesson: '{} ({})'.format(lesson.subject_name, lesson.class_name),
+                         lambda lesson: 'Class {}, classroom {}'.format(lesson.class_name, lesson.classroom_name))
+
+
+@schedule.route('/schedule/<int:year>/<int:semester>/changes.json')
+@replica_reads
+def published_changes(year, semester):
+    """
+    Lessons changed between the published version a client holds (since,
+    0 for none) and the latest one, or version to; limited to one class or
+    teacher with class_id / teacher_id. Feed tokens work for those too
+    """
+    since = request.args.get('since', 0, type=int)
+    to = request.args.get('to', type=int)
+    class_id = request.args.get('class_id', type=int)
+    teacher_id = request.args.get('teacher_id', type=int)
+
+    if current_user.is_authenticated:
+        # like the HTML pages: class timetables for everyone, the rest for teachers
+        if class_id is None:
+            user_access()
+    else:
+        token = request.args.get('token', '')
+        if not ((class_id is not None and check_feed_token(token, 'class', class_id)) or
+                (teacher_id is not None and check_feed_token(token, 'teacher', teacher_id))):
+            abort(403)
+
+    versions = PublishedSchedule.query.filter_by(year=year, semester=semester)
+    new = versions.filter_by(number=to).first_or_404() if to is not None else \
+        versions.order_by(PublishedSchedule.number.desc()).first_or_404()
+    if not 0 <= since <= new.number:
+        abort(400)
+
+    etag = 'changes-{}-{}-{}-{}-{}-{}'.format(year, semester, since, new.number, class_id, teacher_id)
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
+    new = load(new)
+    old = load(versions.filter_by(number=since).first_or_404()) if since else EMPTY
+    changes = filter_diff(diff_versions(old, new), class_id=class_id, teacher_id=teacher_id)
+
+    response = jsonify(year=year, semester=semester, since=since, version=new.number,
+                       **diff_json(changes, old, new))
+    response.set_etag(etag)
+    response.cache_control.private = True
+    if to is None:
+        # the latest version moves on when the next one is published
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.max_age = 31536000
+    return response
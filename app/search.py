@@ -0,0 +1,211 @@
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from flask import current_app
+from sqlalchemy import event, literal, union_all
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import User, Class, Subject, Classroom, USER_SEARCH_DOCUMENT
+
+Hit = namedtuple('Hit', ['kind', 'id', 'label', 'score'])
+
+KINDS = {
+    'user': 'User',
+    'class': 'Class',
+    'subject': 'Subject',
+    'classroom': 'Classroom',
+}
+
+SEARCHED = (User, Class, Subject, Classroom)
+
+
+def tokens(text):
+    return [token for token in text.lower().split() if token]
+
+
+def _like(token):
+    return '%' + token.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _sources():
+    """
+    (kind, id, label, searched text) of every searchable model
+    """
+    user_label = User.last_name + ' ' + User.first_name + ' ' + User.middle_name + ' (' + User.email + ')'
+    return [('user', User.id, user_label, USER_SEARCH_DOCUMENT),
+            ('class', Class.id, Class.name, db.func.lower(Class.name)),
+            ('subject', Subject.id, Subject.name, db.func.lower(Subject.name)),
+            ('classroom', Classroom.id, Classroom.name, db.func.lower(Classroom.name))]
+
+
+def search_trigram(term, limit=20):
+    """
+    One UNION ALL over the trigram indexed documents: every word of the
+    term must occur in the document, ranked by trigram similarity
+    """
+    words = tokens(term)
+    selects = []
+    for kind, id_column, label, document in _sources():
+        query = db.session.query(literal(kind).label('kind'), id_column.label('id'), label.label('label'),
+                                 db.func.similarity(document, term.lower()).label('score'))
+        for word in words:
+            query = query.filter(document.like(_like(word), escape='\\'))
+        best = query.order_by(db.desc('score')).limit(limit).subquery()
+        selects.append(db.select([best]))
+
+    statement = union_all(*selects).alias('hits')
+    rows = db.session.execute(db.select([statement]).order_by(statement.c.score.desc(), statement.c.label)
+                              .limit(limit))
+    return [Hit(*row) for row in rows]
+
+
+def _trigrams(word):
+    return set(word[i:i + 3] for i in range(len(word) - 2))
+
+
+class SearchIndex(object):
+    """
+    In-memory inverted index for databases without trigram indexes.
+
+    Documents are split into words and every word into trigrams, so a
+    substring is found by intersecting a few posting sets instead of
+    scanning every row. After a change to a searched model, or after ttl
+    seconds for bulk writes the session does not see, one background
+    thread rebuilds it while searches keep using the previous index.
+    Only the very first search waits for a build.
+    """
+
+    def __init__(self, ttl=60):
+        self._lock = threading.Lock()
+        self._building = threading.Lock()
+        self.ttl = ttl
+        self.built = None
+        self.stale = False
+        self.labels = {}
+        self.words = {}
+        self.grams = {}
+
+    def invalidate(self):
+        self.stale = True
+
+    def _load(self):
+        session = Session(bind=db.engine)
+        try:
+            for kind, id_column, label, document in _sources():
+                for id, text, words in session.query(id_column, label, document):
+                    yield (kind, id), text, words
+        finally:
+            session.close()
+
+    def build(self):
+        labels = {}
+        words = defaultdict(set)
+        grams = defaultdict(set)
+        for key, label, document in self._load():
+            labels[key] = label
+            for word in document.split():
+                words[word].add(key)
+        for word in words:
+            for gram in _trigrams(word):
+                grams[gram].add(word)
+
+        with self._lock:
+            self.labels, self.words, self.grams = labels, dict(words), dict(grams)
+            self.built = time.time()
+
+    @staticmethod
+    def _matching_words(token, words, grams):
+        if len(token) < 3:
+            return [word for word in words if token in word]
+        postings = sorted((grams.get(gram, ()) for gram in _trigrams(token)), key=len)
+        return [word for word in set.intersection(*map(set, postings)) if token in word] if postings[0] else []
+
+    def _rebuild(self, app):
+        try:
+            with app.app_context():
+                self.build()
+        finally:
+            self._building.release()
+
+    def refresh(self):
+        """
+        Make sure an index exists and start a background rebuild when it
+        is out of date; at most one build runs at a time
+        """
+        if self.built is None:
+            with self._building:
+                if self.built is None:
+                    self.stale = False
+                    self.build()
+            return
+        if not (self.stale or time.time() - self.built > self.ttl):
+            return
+        if self._building.acquire(False):
+            # changes committed from now on are picked up by this build
+            self.stale = False
+            thread = threading.Thread(target=self._rebuild, args=(current_app._get_current_object(),))
+            thread.daemon = True
+            try:
+                thread.start()
+            except:
+                self._building.release()
+                raise
+
+    def search(self, term, limit=20):
+        self.refresh()
+        # a concurrent build() swaps these, keep one consistent set
+        labels, words, grams = self.labels, self.words, self.grams
+
+        scores = None
+        for token in tokens(term):
+            found = defaultdict(float)
+            for word in self._matching_words(token, words, grams):
+                # whole words rank above prefixes, prefixes above inner matches
+                weight = 1.0 if word == token else 0.75 if word.startswith(token) else 0.5
+                for key in words[word]:
+                    found[key] = max(found[key], weight)
+            scores = found if scores is None else dict((key, score + found[key])
+                                                       for key, score in scores.items() if key in found)
+            if not scores:
+                return []
+
+        hits = [Hit(kind, id, labels[(kind, id)], score) for (kind, id), score in (scores or {}).items()]
+        hits.sort(key=lambda hit: (-hit.score, hit.label))
+        return hits[:limit]
+
+
+search_index = SearchIndex()
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_change(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, SEARCHED):
+            session.info['search_changed'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    # only once committed, or a rebuild could miss the change
+    if session.info.pop('search_changed', False):
+        search_index.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_change(session):
+    session.info.pop('search_changed', None)
+
+
+def search(term, limit=20):
+    """
+    Users, classes, subjects and classrooms matching every word of term,
+    best first
+    """
+    if not tokens(term):
+        return []
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return search_trigram(term, limit)
+    return search_index.search(term, limit)
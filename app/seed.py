@@ -0,0 +1,215 @@
+import datetime
+import random
+import uuid
+from collections import defaultdict
+
+from . import db, page_cache
+from .cache import reference_cache, user_cache
+from .grades.ingest import MAX_GRADE, MIN_GRADE
+from .grades.rollups import rebuild as rebuild_rollups
+from .models import (User, Role, Class, Classroom, Specialization, RoomSpecialization, Subject, TypeOfWork,
+                     TeacherToSubject, TeachersClassroom, StudentInClass, ParentToStudent, Schedule, EducationPlan,
+                     Grade)
+from .passwords import hash_password
+from .plans import generate_plans
+from .search import search_index
+from .schedule.versions import bump_version
+from .solver import generate_timetable
+
+EMAIL_DOMAIN = 'seed.school'
+CHUNK_SIZE = 1000
+
+# the views check these role ids: 1 teacher, 2 student, 3 parent
+ROLES = ['Teacher', 'Student', 'Parent']
+SUBJECTS = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'History', 'Geography', 'Literature', 'English',
+            'Informatics', 'Physical education']
+WORK_TYPES = ['Classwork', 'Homework', 'Test']
+
+FIRST_NAMES = [('Ivan', True), ('Petr', True), ('Oleg', True), ('Dmitry', True), ('Andrey', True),
+               ('Anna', False), ('Maria', False), ('Olga', False), ('Elena', False), ('Irina', False)]
+LAST_NAMES = ['Ivanov', 'Petrov', 'Sidorov', 'Smirnov', 'Kuznetsov', 'Popov', 'Sokolov', 'Lebedev', 'Kozlov',
+              'Novikov', 'Morozov', 'Volkov', 'Pavlov', 'Semenov', 'Golubev', 'Vinogradov']
+MIDDLE_NAMES = ['Ivanovich', 'Petrovich', 'Olegovich', 'Dmitrievich', 'Andreevich', 'Sergeevich']
+
+
+class SeedResult(object):
+    """
+    How many rows of each kind were created
+    """
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+
+    def __str__(self):
+        return ', '.join('{} {}'.format(count, name) for name, count in sorted(self.counts.items()))
+
+
+def _insert(table, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(table.insert(), rows[start:start + CHUNK_SIZE])
+
+
+def _ensure(model, names):
+    """
+    Ids of reference rows by name, creating the missing ones in order
+    """
+    existing = dict((row.name, row.id) for row in model.query.filter(model.name.in_(names)))
+    for name in names:
+        if name not in existing:
+            row = model(name=name)
+            db.session.add(row)
+            db.session.flush()
+            existing[name] = row.id
+    return [existing[name] for name in names]
+
+
+def _free_names(model, candidates, count):
+    taken = set(name for name, in db.session.query(model.name))
+    return [name for name in candidates if name not in taken][:count]
+
+
+def _class_names():
+    # class names are at most 3 characters: 1A .. 11Z
+    for letter in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
+        for grade in range(1, 12):
+            yield '{}{}'.format(grade, letter)
+
+
+def _user_rows(rand, role_id, kind, count, token, password_hash, age):
+    today = datetime.date.today()
+    rows = []
+    for number in range(count):
+        first_name, is_man = rand.choice(FIRST_NAMES)
+        rows.append({'email': '{}{}.{}@{}'.format(kind, number, token, EMAIL_DOMAIN),
+                     'password_hash': password_hash,
+                     'first_name': first_name,
+                     'last_name': rand.choice(LAST_NAMES),
+                     'middle_name': rand.choice(MIDDLE_NAMES),
+                     'date_of_birth': datetime.datetime(today.year - rand.randint(*age), rand.randint(1, 12),
+                                                        rand.randint(1, 28)),
+                     'telephone': '+380{:09d}'.format(rand.randint(0, 999999999)),
+                     'role_id': role_id,
+                     'is_admin': False,
+                     'is_man': is_man})
+    return rows
+
+
+def _users(rand, role_id, kind, count, token, password_hash, age):
+    _insert(User.__table__, _user_rows(rand, role_id, kind, count, token, password_hash, age))
+    return [user_id for user_id, in db.session.query(User.id)
+                                               .filter(User.email.like('%.{}@{}'.format(token, EMAIL_DOMAIN)),
+                                                       User.role_id == role_id)
+                                               .order_by(User.id)]
+
+
+def seed_school(teachers=60, students=1000, parents=800, classes=30, classrooms=40, year=None, semester=1,
+                lessons_per_subject=2, grades_per_student=20, password='seed-password', seed=None,
+                time_limit=30.0):
+    """
+    Generate a whole school with bulk inserts: users of every role, classes,
+    classrooms, teacher subjects, the education plan, a clash-free schedule
+    and grades. Every seeded user shares one password hash, hashed once.
+    Returns a SeedResult
+    """
+    rand = random.Random(seed)
+    token = uuid.uuid4().hex[:8]
+    year = year or datetime.date.today().year
+    result = SeedResult()
+
+    teacher_role, student_role, parent_role = _ensure(Role, ROLES)
+    specialization_id, = _ensure(Specialization, ['General'])
+    room_specialization_id, = _ensure(RoomSpecialization, ['General'])
+    subject_ids = _ensure(Subject, SUBJECTS)
+    work_type_ids = _ensure(TypeOfWork, WORK_TYPES)
+
+    password_hash = hash_password(password)
+    teacher_ids = _users(rand, teacher_role, 'teacher', teachers, token, password_hash, (25, 60))
+    student_ids = _users(rand, student_role, 'student', students, token, password_hash, (7, 17))
+    parent_ids = _users(rand, parent_role, 'parent', parents, token, password_hash, (30, 55))
+
+    admin = User(email='admin.{}@{}'.format(token, EMAIL_DOMAIN), first_name='Admin', last_name='Seed',
+                 middle_name='Seed', role_id=teacher_role, is_admin=True, is_man=True)
+    admin.password_hash = password_hash
+    db.session.add(admin)
+    result.counts['users'] = len(teacher_ids) + len(student_ids) + len(parent_ids) + 1
+
+    room_names = _free_names(Classroom, ('R{}'.format(number) for number in range(1, 10000)), classrooms)
+    _insert(Classroom.__table__, [{'name': name, 'room_specialization_id': room_specialization_id}
+                                  for name in room_names])
+    room_ids = [room_id for room_id, in db.session.query(Classroom.id)
+                                                  .filter(Classroom.name.in_(room_names)).order_by(Classroom.id)]
+    result.counts['classrooms'] = len(room_ids)
+
+    if teacher_ids:
+        links = []
+        for number, teacher_id in enumerate(teacher_ids):
+            links.append({'user_id_teacher': teacher_id, 'subject_id': subject_ids[number % len(subject_ids)]})
+            if number % 3 == 0:
+                links.append({'user_id_teacher': teacher_id,
+                              'subject_id': subject_ids[(number + 1) % len(subject_ids)]})
+        _insert(TeacherToSubject.__table__, links)
+        _insert(TeachersClassroom.__table__, [{'user_id_teacher': teacher_id, 'classroom_id': room_id}
+                                              for teacher_id, room_id in zip(teacher_ids, room_ids)])
+        result.counts['teacher subjects'] = len(links)
+
+    class_names = _free_names(Class, _class_names(), classes) if teacher_ids and room_ids else []
+    today = datetime.datetime.utcnow()
+    _insert(Class.__table__, [{'name': name,
+                               'dateStartEducation': today,
+                               'dateEndEducation': today + datetime.timedelta(days=365),
+                               'specialization_id': specialization_id,
+                               'headTeacher': teacher_ids[number % len(teacher_ids)],
+                               'room_id': room_ids[number % len(room_ids)]}
+                              for number, name in enumerate(class_names)])
+    class_ids = [class_id for class_id, in db.session.query(Class.id)
+                                                     .filter(Class.name.in_(class_names)).order_by(Class.id)]
+    result.counts['classes'] = len(class_ids)
+
+    class_students = defaultdict(list)
+    if class_ids:
+        for number, student_id in enumerate(student_ids):
+            class_students[class_ids[number % len(class_ids)]].append(student_id)
+        _insert(StudentInClass.__table__, [{'class_id': class_id, 'user_id_studen': student_id}
+                                           for class_id, students_of_class in class_students.items()
+                                           for student_id in students_of_class])
+    if parent_ids:
+        _insert(ParentToStudent.__table__, [{'user_id_parent': parent_ids[number % len(parent_ids)],
+                                             'user_id_student': student_id}
+                                            for number, student_id in enumerate(student_ids)])
+        result.counts['parent links'] = len(student_ids)
+
+    bump_version()
+    db.session.commit()
+
+    result.counts['plans'] = generate_plans([year], [semester])
+    solution = generate_timetable(year, semester, per_subject=lessons_per_subject, time_limit=time_limit,
+                                  seed=seed)
+    result.counts['lessons'] = len(solution.placements)
+
+    lessons = defaultdict(list)
+    for schedule_id, class_id in db.session.query(Schedule.id, Schedule.class_id) \
+            .join(EducationPlan, EducationPlan.id == Schedule.educationPlan_id) \
+            .filter(EducationPlan.year == year, EducationPlan.semester == semester,
+                    Schedule.class_id.in_(class_ids or [0])):
+        lessons[class_id].append(schedule_id)
+
+    grades = []
+    for class_id, students_of_class in class_students.items():
+        if not lessons[class_id]:
+            continue
+        for student_id in students_of_class:
+            for _ in range(grades_per_student):
+                grades.append({'student_id': student_id,
+                               'schedule_id': rand.choice(lessons[class_id]),
+                               'typeOfWork_id': rand.choice(work_type_ids),
+                               'grade': rand.randint(MIN_GRADE, MAX_GRADE)})
+    _insert(Grade.__table__, grades)
+    db.session.commit()
+    result.counts['grades'] = len(grades)
+    rebuild_rollups(year, semester)
+
+    reference_cache.invalidate()
+    user_cache.invalidate()
+    page_cache.invalidate()
+    search_index.invalidate()
+    return result
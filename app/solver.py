@@ -0,0 +1,222 @@
+import random
+import time
+from collections import namedtuple, defaultdict
+
+from . import db, page_cache
+from .models import Class, Classroom, EducationPlan, Schedule, Subject, TeacherToSubject, TeachersClassroom
+from .schedule.entries import rebuild as rebuild_entries
+from .schedule.versions import bump_version
+
+Slot = namedtuple('Slot', ['plan_id', 'day', 'lesson'])
+
+# one weekly lesson of a subject for a class, taught by a fixed teacher link
+Unit = namedtuple('Unit', ['class_id', 'subject_id', 'teacher_subject_id', 'teacher_id', 'rooms'])
+
+Placement = namedtuple('Placement', ['unit', 'slot', 'classroom_id'])
+
+
+class Solution(object):
+    """
+    Result of one timetable search
+    """
+
+    def __init__(self, placements, unplaced, doubles, penalty, seconds=0.0, attempts=0):
+        self.placements = placements
+        self.unplaced = unplaced
+        self.doubles = doubles
+        self.penalty = penalty
+        self.seconds = seconds
+        self.attempts = attempts
+
+    def better_than(self, other):
+        return other is None or (len(self.unplaced), self.doubles, self.penalty) < \
+                                 (len(other.unplaced), other.doubles, other.penalty)
+
+
+class Bookings(object):
+    """
+    Who and what is busy in every plan slot
+    """
+
+    def __init__(self):
+        self.classes = defaultdict(set)
+        self.teachers = defaultdict(set)
+        self.rooms = defaultdict(set)
+        # (class, day) -> subjects already taught that day
+        self.class_day_subjects = defaultdict(set)
+
+    def book(self, slot, class_id, teacher_id, classroom_id, subject_id):
+        self.classes[slot.plan_id].add(class_id)
+        self.teachers[slot.plan_id].add(teacher_id)
+        self.rooms[slot.plan_id].add(classroom_id)
+        self.class_day_subjects[(class_id, slot.day)].add(subject_id)
+
+    def free_room(self, slot, rooms):
+        busy = self.rooms[slot.plan_id]
+        for room in rooms:
+            if room not in busy:
+                return room
+        return None
+
+
+DOUBLE_PENALTY = 20
+
+
+def _penalty(bookings, unit, slot):
+    # a subject twice a day and late lessons make a worse timetable
+    penalty = slot.lesson
+    if unit.subject_id in bookings.class_day_subjects[(unit.class_id, slot.day)]:
+        penalty += DOUBLE_PENALTY
+    return penalty
+
+
+def _greedy(units, slots, fixed, rand):
+    bookings = Bookings()
+    for slot, class_id, teacher_id, classroom_id, subject_id in fixed:
+        bookings.book(slot, class_id, teacher_id, classroom_id, subject_id)
+
+    placements = []
+    unplaced = []
+    doubles = 0
+    penalty = 0
+    for unit in units:
+        best = None
+        for slot in slots:
+            if unit.class_id in bookings.classes[slot.plan_id] or unit.teacher_id in bookings.teachers[slot.plan_id]:
+                continue
+            room = bookings.free_room(slot, unit.rooms)
+            if room is None:
+                continue
+            score = _penalty(bookings, unit, slot) + rand.random()
+            if best is None or score < best[0]:
+                best = (score, slot, room)
+
+        if best is None:
+            unplaced.append(unit)
+            continue
+
+        score, slot, room = best
+        if score >= DOUBLE_PENALTY:
+            doubles += 1
+        bookings.book(slot, unit.class_id, unit.teacher_id, room, unit.subject_id)
+        placements.append(Placement(unit, slot, room))
+        penalty += int(score)
+
+    return Solution(placements, unplaced, doubles, penalty)
+
+
+def solve(units, slots, fixed=(), time_limit=30.0, max_attempts=50, seed=None):
+    """
+    Place units into slots with no class, teacher or room booked twice.
+
+    Units of the busiest teachers and classes go first, then randomized
+    restarts shuffle ties until every unit is placed without a subject
+    repeated in a day, or the attempts or time run out. The best attempt
+    is returned.
+    """
+    rand = random.Random(seed)
+    started = time.time()
+
+    teacher_load = defaultdict(int)
+    class_load = defaultdict(int)
+    for unit in units:
+        teacher_load[unit.teacher_id] += 1
+        class_load[unit.class_id] += 1
+
+    best = None
+    attempts = 0
+    while True:
+        attempts += 1
+        order = sorted(units, key=lambda unit: (-teacher_load[unit.teacher_id],
+                                                -class_load[unit.class_id],
+                                                len(unit.rooms),
+                                                rand.random()))
+        solution = _greedy(order, slots, fixed, rand)
+        if solution.better_than(best):
+            best = solution
+        if not best.unplaced and not best.doubles \
+                or attempts >= max_attempts or time.time() - started >= time_limit:
+            break
+
+    best.seconds = time.time() - started
+    best.attempts = attempts
+    return best
+
+
+def build_units(year, semester, load, per_subject):
+    """
+    Remaining weekly lessons per class and subject, minus what is already scheduled.
+    load maps subject names to lessons per week, per_subject is used for the rest
+    """
+    subjects = dict((subject.id, subject) for subject in Subject.query)
+    links = defaultdict(list)
+    for link in TeacherToSubject.query:
+        links[link.subject_id].append(link)
+
+    teacher_rooms = dict(db.session.query(TeachersClassroom.user_id_teacher, TeachersClassroom.classroom_id))
+    all_rooms = [room_id for room_id, in db.session.query(Classroom.id).order_by(Classroom.id)]
+
+    scheduled = defaultdict(int)
+    teacher_lessons = defaultdict(int)
+    for class_id, subject_id, teacher_id in db.session.query(Schedule.class_id, TeacherToSubject.subject_id,
+                                                             TeacherToSubject.user_id_teacher) \
+            .join(TeacherToSubject, TeacherToSubject.id == Schedule.teacher_subject_id) \
+            .join(EducationPlan, EducationPlan.id == Schedule.educationPlan_id) \
+            .filter(EducationPlan.year == year, EducationPlan.semester == semester):
+        scheduled[(class_id, subject_id)] += 1
+        teacher_lessons[teacher_id] += 1
+
+    units = []
+    for school_class in Class.query.order_by(Class.name):
+        for subject_id, subject in subjects.items():
+            if not links[subject_id]:
+                continue
+            needed = load.get(subject.name, per_subject) - scheduled[(school_class.id, subject_id)]
+            if needed <= 0:
+                continue
+
+            # one teacher keeps the whole subject for a class, the least loaded one
+            link = min(links[subject_id], key=lambda l: teacher_lessons[l.user_id_teacher])
+            teacher_lessons[link.user_id_teacher] += needed
+
+            preferred = [room for room in (teacher_rooms.get(link.user_id_teacher), school_class.room_id) if room]
+            rooms = tuple(preferred + [room for room in all_rooms if room not in preferred])
+            for _ in range(needed):
+                units.append(Unit(school_class.id, subject_id, link.id, link.user_id_teacher, rooms))
+
+    return units
+
+
+def generate_timetable(year, semester, load=None, per_subject=2, time_limit=30.0, max_attempts=50, seed=None,
+                       commit=True):
+    """
+    Fill the year/semester schedule with a clash-free timetable.
+    Existing lessons stay where they are and count as fixed bookings
+    """
+    slots = [Slot(plan.id, plan.day, plan.lessonNumber)
+             for plan in EducationPlan.query.filter_by(year=year, semester=semester)
+                                            .order_by(EducationPlan.day, EducationPlan.lessonNumber)]
+    slot_by_plan = dict((slot.plan_id, slot) for slot in slots)
+
+    fixed = [(slot_by_plan[plan_id], class_id, teacher_id, classroom_id, subject_id)
+             for plan_id, class_id, teacher_id, classroom_id, subject_id in
+             db.session.query(Schedule.educationPlan_id, Schedule.class_id, TeacherToSubject.user_id_teacher,
+                              Schedule.classroom_id, TeacherToSubject.subject_id)
+                 .join(TeacherToSubject, TeacherToSubject.id == Schedule.teacher_subject_id)
+                 .filter(Schedule.educationPlan_id.in_(list(slot_by_plan)))] if slots else []
+
+    units = build_units(year, semester, load or {}, per_subject)
+    solution = solve(units, slots, fixed, time_limit, max_attempts, seed)
+
+    if commit and solution.placements:
+        db.session.execute(Schedule.__table__.insert(),
+                           [{'classroom_id': placement.classroom_id,
+                             'class_id': placement.unit.class_id,
+                             'teacher_subject_id': placement.unit.teacher_subject_id,
+                             'educationPlan_id': placement.slot.plan_id} for placement in solution.placements])
+        rebuild_entries(year, semester)
+        bump_version()
+        db.session.commit()
+        page_cache.invalidate('schedule')
+
+    return solution
@@ -0,0 +1,29 @@
+// Load user options on demand for UserSearchField inputs
+$(function () {
+    $(document).on('input', 'input[data-typeahead]', function () {
+        var input = $(this);
+        var hidden = $('#' + input.data('target'));
+        var options = $('#' + input.attr('list'));
+        var term = input.val();
+
+        var chosen = options.find('option').filter(function () {
+            return this.value === term;
+        });
+        if (chosen.length) {
+            hidden.val(chosen.data('id'));
+            return;
+        }
+
+        hidden.val('');
+        if (term.length < 2) {
+            return;
+        }
+
+        $.getJSON(input.data('typeahead'), {q: term}, function (users) {
+            options.empty();
+            $.each(users, function (i, user) {
+                $('<option>').val(user.label).attr('data-id', user.id).appendTo(options);
+            });
+        });
+    });
+});
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from werkzeug.security import check_password_hash
+
+from .passwords import hash_function, needs_rehash
+
+
+class LoginBusy(Exception):
+    """
+    No room left to verify another password right now
+    """
+
+
+class Throttle(object):
+    """
+    Token bucket per key: burst attempts at once, then rate per minute.
+    The least recently used keys are dropped past max_keys
+    """
+
+    def __init__(self, burst, per_minute, max_keys=10000):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self.burst = burst
+        self.rate = per_minute / 60.0
+        self.max_keys = max_keys
+
+    def allow(self, key):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed
+
+
+class LoginGuard(object):
+    """
+    Throttles login attempts per email and per IP and verifies password
+    hashes in a bounded thread pool, so a burst of logins cannot pin every
+    worker on the deliberately slow hash. Waiting verifications are capped
+    by LOGIN_HASH_QUEUE; past it logins are rejected at once
+    """
+
+    def __init__(self, app=None):
+        self.executor = None
+        self.slots = None
+        self.timeout = 5
+        self.enabled = True
+        self.emails = None
+        self.ips = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config.get('LOGIN_HASH_WORKERS', 4)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(workers + app.config.get('LOGIN_HASH_QUEUE', 16))
+        self.timeout = app.config.get('LOGIN_HASH_TIMEOUT', 5)
+        self.enabled = app.config.get('LOGIN_THROTTLE', True)
+        self.emails = Throttle(app.config.get('LOGIN_EMAIL_BURST', 5), app.config.get('LOGIN_EMAIL_PER_MINUTE', 2))
+        self.ips = Throttle(app.config.get('LOGIN_IP_BURST', 100), app.config.get('LOGIN_IP_PER_MINUTE', 120))
+
+    def throttled(self, email, ip):
+        """
+        'email' or 'ip' when the attempt is over its limit, None otherwise
+        """
+        if not self.enabled:
+            return None
+        if not self.ips.allow(ip):
+            return 'ip'
+        if not self.emails.allow(email.strip().lower()):
+            return 'email'
+        return None
+
+    def _run(self, function, *args):
+        if not self.slots.acquire(False):
+            raise LoginBusy()
+        future = self.executor.submit(function, *args)
+        # the slot is held until the work is really done, not until we stop waiting
+        future.add_done_callback(lambda done: self.slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            raise LoginBusy()
+
+    def verify(self, user, password):
+        """
+        Check the password; raises LoginBusy when the pool is full
+        """
+        return self._run(check_password_hash, user.password_hash, password)
+
+    def rehash(self, user, password):
+        """
+        New hash when the stored one was made with old parameters, else None
+        """
+        if not needs_rehash(user.password_hash):
+            return None
+        try:
+            # resolved here, the pool threads have no app context for the config
+            return self._run(hash_function(), password)
+        except LoginBusy:
+            return None
@@ -0,0 +1,252 @@
+import csv
+import datetime
+import io
+import json
+import re
+from collections import namedtuple
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+
+from . import db, page_cache
+from .cache import reference_cache
+from .grades.ingest import ImportResult
+from .models import User, Role, Class, StudentInClass, ParentToStudent
+from .passwords import hash_function
+from .search import search_index
+
+BATCH_SIZE = 500
+MIN_PASSWORD_LENGTH = 11
+STUDENT_ROLE_ID = 2
+PARENT_ROLE_ID = 3
+
+EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'm', 'man', 'male')
+FALSE_VALUES = ('', '0', 'false', 'no', 'n', 'f', 'woman', 'female')
+
+UserRow = namedtuple('UserRow', ['email', 'first_name', 'last_name', 'middle_name', 'date_of_birth', 'telephone',
+                                 'password', 'role_id', 'is_man', 'class_name', 'parent_of'])
+
+
+def _text(data, name, length, required=True):
+    value = str(data.get(name) or '').strip()
+    if required and not value:
+        raise ValueError('missing field {}'.format(name))
+    if len(value) > length:
+        raise ValueError('{} is longer than {} characters'.format(name, length))
+    return value
+
+
+def _role_id(value):
+    value = str(value or '').strip()
+    for role in reference_cache.all(Role):
+        if value == str(role.id) or value.lower() == role.name.lower():
+            return role.id
+    raise ValueError('unknown role {}'.format(value or '(empty)'))
+
+
+def parse_row(data):
+    """
+    UserRow from a CSV/JSON mapping; raises ValueError on bad input
+    """
+    if not isinstance(data, dict):
+        raise ValueError('row must be an object')
+
+    email = _text(data, 'email', 50).lower()
+    if not EMAIL.match(email):
+        raise ValueError('invalid email {}'.format(email))
+
+    password = str(data.get('password') or '')
+    if len(password) < MIN_PASSWORD_LENGTH:
+        raise ValueError('password must be longer than {} characters'.format(MIN_PASSWORD_LENGTH - 1))
+
+    date_of_birth = str(data.get('date_of_birth') or '').strip()
+    try:
+        date_of_birth = datetime.datetime.strptime(date_of_birth, '%Y-%m-%d') if date_of_birth else None
+    except ValueError:
+        raise ValueError('date_of_birth must look like 2005-09-01')
+
+    is_man = str(data.get('is_man', '')).strip().lower()
+    if is_man not in TRUE_VALUES + FALSE_VALUES:
+        raise ValueError('is_man must be true or false')
+
+    parent_of = data.get('parent_of') or []
+    if not isinstance(parent_of, list):
+        parent_of = str(parent_of).split(';')
+    parent_of = tuple(str(item).strip().lower() for item in parent_of if str(item).strip())
+
+    role_id = _role_id(data.get('role'))
+    class_name = _text(data, 'class', 3, required=False) or None
+    if class_name and role_id != STUDENT_ROLE_ID:
+        raise ValueError('only students can be put into a class')
+    if parent_of and role_id != PARENT_ROLE_ID:
+        raise ValueError('only parents can have parent_of')
+
+    return UserRow(email=email,
+                   first_name=_text(data, 'first_name', 30),
+                   last_name=_text(data, 'last_name', 30),
+                   middle_name=_text(data, 'middle_name', 30),
+                   date_of_birth=date_of_birth,
+                   telephone=_text(data, 'telephone', 20, required=False) or None,
+                   password=password,
+                   role_id=role_id,
+                   is_man=is_man in TRUE_VALUES,
+                   class_name=class_name,
+                   parent_of=parent_of)
+
+
+class PasswordHasher(object):
+    """
+    Password hashing spread over worker processes; it is slow on purpose,
+    so a batch of passwords keeps every core busy
+    """
+
+    def __init__(self, workers=None):
+        self.function = hash_function()
+        self.workers = workers or cpu_count()
+        self.pool = Pool(self.workers) if self.workers > 1 else None
+
+    def hash(self, passwords):
+        if self.pool is None or len(passwords) < 2:
+            return [self.function(password) for password in passwords]
+        return self.pool.map(self.function, passwords,
+                             chunksize=max(1, len(passwords) // (self.workers * 4)))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+def save_batch(rows, numbers, hasher, imported, result):
+    """
+    Insert one batch of parsed rows with their class and parent links.
+    One query finds emails already taken, one resolves the classes and
+    one the parents' students that were not imported in this run
+    """
+    taken = set(email for email, in db.session.query(User.email)
+                .filter(User.email.in_([row.email for row in rows])))
+    class_ids = dict(db.session.query(Class.name, Class.id)
+                     .filter(Class.name.in_(set(row.class_name for row in rows if row.class_name))))
+
+    valid = []
+    for row in rows:
+        if row.email in taken:
+            result.errors.append((numbers[row.email], 'email {} is already in use'.format(row.email)))
+        elif row.class_name and row.class_name not in class_ids:
+            result.errors.append((numbers[row.email], 'unknown class {}'.format(row.class_name)))
+        else:
+            valid.append(row)
+    if not valid:
+        return
+
+    hashes = hasher.hash([row.password for row in valid])
+    db.session.execute(User.__table__.insert(),
+                       [{'email': row.email,
+                         'password_hash': password_hash,
+                         'first_name': row.first_name,
+                         'last_name': row.last_name,
+                         'middle_name': row.middle_name,
+                         'date_of_birth': row.date_of_birth or datetime.datetime.utcnow(),
+                         'telephone': row.telephone,
+                         'role_id': row.role_id,
+                         'is_admin': False,
+                         'is_man': row.is_man} for row, password_hash in zip(valid, hashes)])
+    imported.update(db.session.query(User.email, User.id).filter(User.email.in_([row.email for row in valid])))
+    result.inserted += len(valid)
+
+    links = [{'class_id': class_ids[row.class_name], 'user_id_studen': imported[row.email]}
+             for row in valid if row.class_name]
+    if links:
+        db.session.execute(StudentInClass.__table__.insert(), links)
+
+    wanted = set(email for row in valid for email in row.parent_of if email not in imported)
+    students = dict(db.session.query(User.email, User.id).filter(User.email.in_(wanted))) if wanted else {}
+    links = []
+    for row in valid:
+        for email in row.parent_of:
+            student_id = imported.get(email) or students.get(email)
+            if student_id is None:
+                result.errors.append((numbers[row.email], 'unknown student {}, parent link skipped'.format(email)))
+            else:
+                links.append({'user_id_parent': imported[row.email], 'user_id_student': student_id})
+    if links:
+        db.session.execute(ParentToStudent.__table__.insert(), links)
+
+
+def import_users(records, batch_size=BATCH_SIZE, workers=None):
+    """
+    Validate and insert an iterable of user mappings batch by batch in one
+    transaction. Students are put into their class and parents linked to
+    their children, listed before them or already in the database
+    """
+    result = ImportResult()
+    imported = {}
+    seen = set()
+    hasher = PasswordHasher(workers)
+    records = enumerate(records, 1)
+    try:
+        while True:
+            batch = list(islice(records, batch_size))
+            if not batch:
+                break
+
+            rows = []
+            numbers = {}
+            for number, data in batch:
+                try:
+                    row = parse_row(data)
+                except ValueError as error:
+                    result.errors.append((number, str(error)))
+                    continue
+                if row.email in seen:
+                    result.errors.append((number, 'email {} appears twice in the file'.format(row.email)))
+                    continue
+                seen.add(row.email)
+                rows.append(row)
+                numbers[row.email] = number
+
+            if rows:
+                save_batch(rows, numbers, hasher, imported, result)
+    finally:
+        hasher.close()
+
+    db.session.commit()
+    page_cache.invalidate('classes')
+    search_index.invalidate()
+    result.errors.sort()
+    return result
+
+
+def csv_records(stream):
+    """
+    Rows of a CSV file, read lazily
+    """
+    return csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8'))
+
+
+def json_records(stream):
+    """
+    Records of a JSON list, or of JSON lines read lazily
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8')
+    first = text.read(1)
+    while first.isspace():
+        first = text.read(1)
+    if first == '[':
+        return json.loads(first + text.read())
+    return (json.loads(line) for line in _prepend(first, text) if line.strip())
+
+
+def _prepend(first, text):
+    yield first + text.readline()
+    for line in text:
+        yield line
+
+
+def file_records(stream, filename):
+    """
+    Records of an uploaded or local file, by its extension
+    """
+    if filename.lower().endswith(('.json', '.jsonl')):
+        return json_records(stream)
+    return csv_records(stream)
@@ -1,8 +1,75 @@
+import os
+
+
 class Config(object):
     """
     Common configurations
     """
 
+    # seconds a logged-in user snapshot is served without a database hit
+    USER_CACHE_TTL = 300
+    # seconds other worker processes may serve roles, subjects, ... after an edit
+    REFERENCE_CACHE_TTL = 60
+
+    # requests kept per endpoint for the percentiles on /admin/metrics
+    METRICS_SAMPLE_SIZE = 1000
+
+    # where report cards are written, <instance>/report_cards when empty
+    REPORT_CARDS_DIR = None
+    # inputs and logs of background manage.py jobs, <instance>/jobs when empty
+    JOBS_DIR = None
+
+    # start of every lesson and its length in minutes, for calendar feeds
+    LESSON_TIMES = ['08:00', '08:55', '09:50', '10:55', '11:50', '12:45', '13:40', '14:35']
+    LESSON_DURATION = 45
+
+    # rendered schedule and dashboard pages: 'memory', 'disk' or None to disable
+    PAGE_CACHE_BACKEND = 'memory'
+    # entries kept by the memory backend
+    PAGE_CACHE_SIZE = 1000
+    # where the disk backend writes, <instance>/page_cache when empty
+    PAGE_CACHE_DIR = None
+    # seconds a page is served before it is rendered again
+    PAGE_CACHE_TTL = 300
+
+    # hash method of new passwords, e.g. 'pbkdf2:sha256:600000'; older hashes
+    # are replaced on the next successful login. None for werkzeug's default
+    PASSWORD_HASH_METHOD = None
+
+    # threads verifying login passwords, logins waiting for one of them,
+    # and seconds a login waits before it is turned away
+    LOGIN_HASH_WORKERS = 4
+    LOGIN_HASH_QUEUE = 16
+    LOGIN_HASH_TIMEOUT = 5
+    # login attempts: a burst at once, then so many per minute
+    LOGIN_THROTTLE = True
+    LOGIN_EMAIL_BURST = 5
+    LOGIN_EMAIL_PER_MINUTE = 2
+    # one school network is one IP, so this one is generous
+    LOGIN_IP_BURST = 100
+    LOGIN_IP_PER_MINUTE = 120
+
+    # processes hashing passwords of imported users, CPU count when empty
+    USER_IMPORT_WORKERS = None
+
+    # connection pool of the primary and the replica, see app/database.py
+    DATABASE_POOL_SIZE = 5
+    DATABASE_MAX_OVERFLOW = 10
+    # seconds a request waits for a free connection before failing with 503
+    DATABASE_POOL_TIMEOUT = 30
+    # seconds after which a connection is replaced, below server/proxy idle limits
+    DATABASE_POOL_RECYCLE = 1800
+    # test connections on checkout so a restarted server costs no failed requests
+    DATABASE_POOL_PRE_PING = True
+    # milliseconds, None for the server default
+    DATABASE_STATEMENT_TIMEOUT = None
+    # PgBouncer in transaction mode does the pooling and keeps no session settings
+    DATABASE_PGBOUNCER = False
+    # read-only replica for reporting views, bound as 'replica'
+    DATABASE_REPLICA_URI = None
+    # seconds a user's reads stay on the primary after their own write
+    DATABASE_REPLICA_LAG = 10
+
 
 class DevelopmentConfig(Config):
     """
@@ -20,8 +87,51 @@ class ProductionConfig(Config):
 
     DEBUG = False
 
+    # sized for the morning login spike, every value can come from the environment
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 20))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 20))
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT', 10))
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))
+    DATABASE_STATEMENT_TIMEOUT = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT', 30000))
+    DATABASE_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URI')
+
+
+class PgBouncerConfig(ProductionConfig):
+    """
+    Production behind PgBouncer in transaction pooling mode
+    """
+
+    DATABASE_PGBOUNCER = True
+
+
+class TestingConfig(Config):
+    """
+    Testing configurations, an in-memory database instead of instance/config.py
+    """
+
+    TESTING = True
+    SECRET_KEY = 'testing'
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    WTF_CSRF_ENABLED = False
+    PAGE_CACHE_BACKEND = None
+    LOGIN_THROTTLE = False
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1'
+
+
+class LoadTestConfig(ProductionConfig):
+    """
+    Server for "manage.py loadtest": every client comes from one address
+    and logs in again and again, so login throttling is off
+    """
+
+    LOGIN_THROTTLE = False
+
 
 app_config = {
     'development': DevelopmentConfig,
-    'production': ProductionConfig
+    'production': ProductionConfig,
+    'pgbouncer': PgBouncerConfig,
+    'testing': TestingConfig,
+    'loadtest': LoadTestConfig
 }
@@ -1,10 +1,21 @@
 import os
+import time
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
-from app import create_app, db
+from app import create_app, db, page_cache
+from app.plans import generate_plans
+from app.solver import generate_timetable
+from app.grades.rollups import rebuild as rebuild_rollups
+from app.schedule.entries import rebuild as rebuild_entries
+from app.schedule.versions import bump_version
+from app.grades.report_cards import generate_report_cards
+from app.models import Class
+from app.seed import seed_school
+from app.user_import import file_records, import_users as import_user_records
+from app import loadtest as load_test
 
-app = create_app('development')
+app = create_app(os.getenv('FLASK_CONFIG', 'development'))
 
 migrate = Migrate(app, db)
 manager = Manager(app)
@@ -13,5 +24,149 @@ manager = Manager(app)
 # so that we can run the migrations from the command line
 manager.add_command('db', MigrateCommand)
 
+
+def _int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+@manager.option('-y', '--years', dest='years', required=True, help='Comma separated years, e.g. 2018,2019')
+@manager.option('-s', '--semesters', dest='semesters', default='1,2', help='Comma separated semesters')
+@manager.option('-d', '--days', dest='days', default='1,2,3,4,5,6', help='Comma separated days of week')
+@manager.option('-l', '--lessons', dest='lessons', default=7, type=int, help='Lessons per day')
+def plans(years, semesters, days, lessons):
+    """
+    Generate the education plan grid for several years at once
+    """
+    created = generate_plans(_int_list(years), _int_list(semesters), _int_list(days), range(1, lessons + 1))
+    print('Created {} plans'.format(created))
+
+
+@manager.option('-y', '--year', dest='year', type=int, required=True, help='Plan year')
+@manager.option('-s', '--semester', dest='semester', type=int, required=True, help='Plan semester')
+@manager.option('-l', '--load', dest='load', default='', help='Weekly lessons per subject, e.g. "Math=4,Physics=2"')
+@manager.option('-p', '--per-subject', dest='per_subject', type=int, default=2,
+                help='Weekly lessons for subjects missing in --load')
+@manager.option('-t', '--time-limit', dest='time_limit', type=float, default=50.0, help='Seconds to search')
+@manager.option('--seed', dest='seed', type=int, default=None, help='Random seed for repeatable results')
+@manager.option('--dry-run', dest='dry_run', action='store_true', help='Report without saving')
+def timetable(year, semester, load, per_subject, time_limit, seed, dry_run):
+    """
+    Generate a clash-free schedule for a year/semester
+    """
+    weekly = {}
+    for item in load.split(','):
+        if item:
+            name, count = item.rsplit('=', 1)
+            weekly[name.strip()] = int(count)
+
+    solution = generate_timetable(year, semester, weekly, per_subject, time_limit, seed=seed, commit=not dry_run)
+    print('Placed {} lessons, unplaced {}, subject repeated in a day {} times'.format(
+        len(solution.placements), len(solution.unplaced), solution.doubles))
+    print('Penalty {}, {} attempts in {:.2f}s'.format(solution.penalty, solution.attempts, solution.seconds))
+
+
+@manager.option('-y', '--year', dest='year', type=int, required=True, help='Plan year')
+@manager.option('-s', '--semester', dest='semester', type=int, required=True, help='Plan semester')
+def rollups(year, semester):
+    """
+    Rebuild grade statistics of a year/semester from the grades table
+    """
+    print('Rolled up {} grades'.format(rebuild_rollups(year, semester)))
+
+
+@manager.option('-y', '--year', dest='year', type=int, default=None, help='Plan year, all years by default')
+@manager.option('-s', '--semester', dest='semester', type=int, default=None, help='Plan semester, both by default')
+def timetable_entries(year, semester):
+    """
+    Rebuild the timetable_entries read table from the schedule tables
+    """
+    count = rebuild_entries(year, semester)
+    bump_version()
+    db.session.commit()
+    page_cache.invalidate('schedule')
+    print('Rebuilt {} timetable entries'.format(count))
+
+
+@manager.option('-y', '--year', dest='year', type=int, required=True, help='Plan year')
+@manager.option('-s', '--semester', dest='semester', type=int, required=True, help='Plan semester')
+@manager.option('-c', '--classes', dest='classes', default='', help='Comma separated class names, all by default')
+@manager.option('-o', '--output', dest='output', default=None, help='Output directory')
+@manager.option('-w', '--workers', dest='workers', type=int, default=None, help='Worker processes, CPU count by default')
+def report_cards(year, semester, classes, output, workers):
+    """
+    Generate report cards for a class or the whole school
+    """
+    class_ids = None
+    if classes:
+        names = [name.strip() for name in classes.split(',') if name.strip()]
+        class_ids = [class_id for class_id, in db.session.query(Class.id).filter(Class.name.in_(names))]
+
+    output = output or app.config['REPORT_CARDS_DIR'] or os.path.join(app.instance_path, 'report_cards')
+    started = time.time()
+    written = generate_report_cards(output, year, semester, class_ids, workers)
+    print('Wrote {} report cards to {} in {:.1f}s'.format(written, output, time.time() - started))
+
+
+@manager.option('--teachers', dest='teachers', type=int, default=60, help='Teachers to create')
+@manager.option('--students', dest='students', type=int, default=1000, help='Students to create')
+@manager.option('--parents', dest='parents', type=int, default=800, help='Parents to create')
+@manager.option('--classes', dest='classes', type=int, default=30, help='Classes to create')
+@manager.option('--classrooms', dest='classrooms', type=int, default=40, help='Classrooms to create')
+@manager.option('-y', '--year', dest='year', type=int, default=None, help='Plan year, the current one by default')
+@manager.option('-s', '--semester', dest='semester', type=int, default=1, help='Plan semester')
+@manager.option('-p', '--per-subject', dest='per_subject', type=int, default=2, help='Weekly lessons per subject')
+@manager.option('-g', '--grades', dest='grades', type=int, default=20, help='Grades per student')
+@manager.option('--password', dest='password', default='seed-password', help='Password of every seeded user')
+@manager.option('--seed', dest='seed', type=int, default=None, help='Random seed for repeatable data')
+def seed(teachers, students, parents, classes, classrooms, year, semester, per_subject, grades, password, seed):
+    """
+    Generate a synthetic school with bulk inserts
+    """
+    started = time.time()
+    result = seed_school(teachers, students, parents, classes, classrooms, year, semester, per_subject, grades,
+                         password, seed)
+    print('Created {} in {:.1f}s'.format(result, time.time() - started))
+
+
+@manager.option('-f', '--file', dest='path', required=True, help='CSV, JSON list or JSON lines file')
+@manager.option('-b', '--batch', dest='batch', type=int, default=500, help='Rows per batch')
+@manager.option('-w', '--workers', dest='workers', type=int, default=None,
+                help='Password hashing processes, CPU count by default')
+def import_users(path, batch, workers):
+    """
+    Bulk import users with their class and parent links
+    """
+    started = time.time()
+    with open(path, 'rb') as stream:
+        result = import_user_records(file_records(stream, path), batch, workers or app.config['USER_IMPORT_WORKERS'])
+    for number, error in result.errors:
+        print('Row {}: {}'.format(number, error))
+    print('Imported {} users with {} errors in {:.1f}s'.format(result.inserted, len(result.errors),
+                                                                     time.time() - started))
+
+
+@manager.option('-u', '--url', dest='url', default='http://127.0.0.1:5000', help='Running server to load')
+@manager.option('-S', '--scenarios', dest='scenarios', default=','.join(sorted(load_test.SCENARIOS)),
+                help='Comma separated scenarios')
+@manager.option('-c', '--clients', dest='clients', type=int, default=10, help='Concurrent clients')
+@manager.option('-d', '--duration', dest='duration', type=float, default=30.0, help='Seconds to run')
+@manager.option('--password', dest='password', default='seed-password', help='Password of the seeded users')
+@manager.option('--seed', dest='seed', type=int, default=None, help='Random seed for repeatable runs')
+def loadtest(url, scenarios, clients, duration, password, seed):
+    """
+    Load a running server with seeded users and report throughput and latency percentiles.
+    Start the server with FLASK_CONFIG=loadtest, or login throttling turns the clients away
+    """
+    names = [name.strip() for name in scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in load_test.SCENARIOS]
+    if unknown:
+        print('Unknown scenarios: {}'.format(', '.join(unknown)))
+        return
+
+    context = load_test.Context(password)
+    results, seconds = load_test.run(url, names, context, clients, duration, seed)
+    print(results.report(seconds))
+
+
 if __name__ == '__main__':
     manager.run()
@@ -1,7 +1,8 @@
+import os
+
 from app import create_app
 
-# config_name = os.getenv('FLASK_CONFIG')
-config_name = 'development'
+config_name = os.getenv('FLASK_CONFIG', 'development')
 app = create_app(config_name)
 
 if __name__ == '__main__':
@@ -0,0 +1,89 @@
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import (User, Role, Subject, TeacherToSubject, RoomSpecialization, Classroom, TeachersClassroom,
+                        Specialization, Class)
+
+PASSWORD = 'password-for-tests'
+
+
+class TeacherListQueriesTestCase(unittest.TestCase):
+    """
+    The teachers list must not issue queries per teacher on the page
+    """
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+
+        db.session.add(Role(id=1, name='Teacher'))
+        db.session.add(RoomSpecialization(id=1, name='General'))
+        db.session.add(Specialization(id=1, name='General'))
+        db.session.add(User(email='admin@school.test', password=PASSWORD, first_name='Admin',
+                            last_name='Admin', middle_name='Admin', role_id=1, is_admin=True, is_man=True))
+        db.session.commit()
+        self.teachers = 0
+
+        self.client = self.app.test_client()
+        response = self.client.post('/login', data={'email': 'admin@school.test', 'password': PASSWORD})
+        self.assertEqual(response.status_code, 302)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def add_teachers(self, count):
+        """
+        Teachers with a subject, a classroom and a head class each
+        """
+        for _ in range(count):
+            self.teachers += 1
+            number = self.teachers
+            teacher = User(email='teacher{}@school.test'.format(number), password=PASSWORD,
+                           first_name='First', last_name='Teacher{:03}'.format(number), middle_name='Middle',
+                           role_id=1, is_man=True)
+            subject = Subject(name='Subject {}'.format(number))
+            classroom = Classroom(name='R{}'.format(number), room_specialization_id=1)
+            db.session.add_all([teacher, subject, classroom])
+            db.session.flush()
+            db.session.add_all([TeacherToSubject(subject_id=subject.id, user_id_teacher=teacher.id),
+                                TeachersClassroom(classroom_id=classroom.id, user_id_teacher=teacher.id),
+                                Class(name='{}'.format(number), specialization_id=1, headTeacher=teacher.id,
+                                      room_id=classroom.id)])
+        db.session.commit()
+
+    def count_queries(self, path):
+        """
+        Statements a warm request to path sends to the database
+        """
+        self.assertEqual(self.client.get(path).status_code, 200)
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            self.assertEqual(self.client.get(path).status_code, 200)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return len(statements)
+
+    def test_query_count_does_not_grow_with_teachers(self):
+        self.add_teachers(2)
+        few = self.count_queries('/admin/teachers/list/1')
+
+        self.add_teachers(7)
+        many = self.count_queries('/admin/teachers/list/1')
+
+        self.assertEqual(few, many)
+
+
+if __name__ == '__main__':
+    unittest.main()
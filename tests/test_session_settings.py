@@ -0,0 +1,46 @@
+import os
+import unittest
+
+from sqlalchemy import create_engine
+
+from app.database import _session_settings
+
+POSTGRES_URI = os.environ.get('TEST_POSTGRES_URI')
+
+
+@unittest.skipUnless(POSTGRES_URI, 'TEST_POSTGRES_URI is not set')
+class SessionSettingsTestCase(unittest.TestCase):
+    """
+    Per-connection settings must outlive the pool's rollback on return
+    """
+
+    def setUp(self):
+        self.engine = create_engine(POSTGRES_URI, pool_size=1, max_overflow=0)
+        _session_settings(self.engine, 1234, True)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def show(self, connection, setting):
+        cursor = connection.cursor()
+        cursor.execute('SHOW ' + setting)
+        value = cursor.fetchone()[0]
+        cursor.close()
+        return value
+
+    def test_settings_survive_rollback(self):
+        connection = self.engine.raw_connection()
+        self.assertEqual(self.show(connection, 'statement_timeout'), '1234ms')
+        connection.rollback()
+        connection.close()
+
+        connection = self.engine.raw_connection()
+        try:
+            self.assertEqual(self.show(connection, 'statement_timeout'), '1234ms')
+            self.assertEqual(self.show(connection, 'default_transaction_read_only'), 'on')
+        finally:
+            connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()